@@ -1,10 +1,35 @@
 import os
+import sys
+import argparse
+from az_daemon_client import forward
+
+parser = argparse.ArgumentParser(description="Update resource tags from a spreadsheet.")
+parser.add_argument('sheet', nargs='?', default='resource_tags.xlsx', help=".xlsx, .csv, .csv.gz or .parquet, or a plan written by az_tag_plan.py")
+parser.add_argument('--resume', nargs='?', const=True, default=False, metavar='RUN',
+                    help="Continue the last run of this sheet (or the given run), skipping the rows it completed")
+args = parser.parse_args()
+
+# A running az_daemon.py takes the whole run, with its credential and caches already warm. This happens
+# before the remaining imports, so a forwarded run never loads pandas or the Azure SDK.
+daemon_job = forward('bulk_update', argv=sys.argv[1:])
+if daemon_job:
+    sys.exit(0 if daemon_job['status'] == 'succeeded' else 1)
+
+import time
+import threading
 import logging
-import pandas as pd
+from functools import partial
 from datetime import datetime
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
-from azure.mgmt.resource.resources.models import GenericResource, Sku
+from az_resource_filter import ResourceTypeFilter
+from az_resource_lookup import ResourceLookup, parse_resource_id
+from az_session import azure_session
+from az_tag_writer import TagWriter
+from az_bulk_executor import BulkTagExecutor
+from az_lro import lro_scheduler
+from az_tag_reader import read_rows, row_tags
+from az_tag_journal import TagJournal, journal_path, row_key
+from az_event_log import event_log, elapsed_ms
+from az_metrics import metrics
 
 # Set the default log directory to the user's home directory
 log_directory = os.path.join(os.path.expanduser("~"), "ResourceTagLogs")
@@ -13,56 +38,110 @@ if not os.path.exists(log_directory):
 
 # Set up logging
 log_file_path = os.path.join(log_directory, f"ResourceTagUpdate_{datetime.now().strftime('%Y%m%d')}.log")
-logging.basicConfig(filename=log_file_path, level=logging.DEBUG, format='%(asctime)s - %(message)s')
+logging.basicConfig(filename=log_file_path, level=logging.INFO, format='%(asctime)s - %(message)s')
 
 def log_and_print(message):
     print(message)
-    logging.debug(message)
+    logging.info(message)
 
-# Authenticate to Azure
-credential = DefaultAzureCredential()
+# AZ_PROFILE=1 captures a cProfile of the main thread
+metrics.start_profile()
 
-# Load the Excel file
-excel_file = 'resource_tags.xlsx'
-df = pd.read_excel(excel_file)
+# Authenticate to Azure once; every subscription's client shares the credential and connection pool
+azure_session.authenticate(log=log_and_print)
 
-successful_updates_count = 0
+# Optional resource type rules (same format as resource_filters.json) for types that must not be retagged
+tag_filter_file = os.environ.get('AZ_TAG_FILTERS')
+type_filter = ResourceTypeFilter.from_file(tag_filter_file) if tag_filter_file else ResourceTypeFilter()
+
+# Each resource group is listed only once
+lookup = ResourceLookup()
+tag_writer = TagWriter(log=log_and_print)
+
+# Updates run concurrently, rate limited per subscription and retried when ARM throttles. Workers only send
+# the initial request, long-running operations are then polled together by the LRO scheduler.
+executor = BulkTagExecutor(log=log_and_print)
+
+# Stream the sheet in chunks
+excel_file = args.sheet
 
-# Iterate through each row in the DataFrame
-for index, row in df.iterrows():
-    subscription_id = row['subscription_id']
-    resource_group_name = row['resource_group_name']
-    resource_name = row['resource_name']
-    resource_type = row.get('resource_type', None)  # Handle missing column gracefully
-    resource_type = str(resource_type) if not pd.isna(resource_type) else None  # Ensure resource_type is a string or None
-    owner_tag = row['owner_tag']
-    application_tag = row['application_tag']
-    environment_tag = row['environment_tag']
-    cost_center_tag = row['cost_center_tag']
-
-    tags = {
-        "owner": owner_tag,
-        "application": application_tag,
-        "environment": environment_tag,
-        "cost-center": cost_center_tag
-    }
-
-    # Initialize the Resource Management Client
-    client = ResourceManagementClient(credential, subscription_id)
-
-    # Get the resource by name, and type if provided
+# Every row's prior tags, new tags and outcome are journaled so an interrupted run can be resumed
+journal_file = os.environ.get('AZ_TAG_JOURNAL') or journal_path(os.path.splitext(os.path.basename(excel_file))[0])
+journal = TagJournal(journal_file)
+try:
+    completed_rows = journal.start(resume=args.resume)
+except ValueError as e:
+    parser.error(str(e))
+if args.resume:
+    log_and_print(f"Resuming run {journal.run_id}: {len(completed_rows)} rows already completed.")
+
+successful_updates_count = 0
+submitted_updates = 0
+finished_updates = threading.Semaphore(0)
+count_lock = threading.Lock()
+
+def record_outcome(key, row_number, resource, resource_name, changed_tags, stats, future):
+    # Journals each update as soon as it completes, so a crash later in the run loses no finished rows
+    global successful_updates_count
+    entry = dict(row=row_number, resource_id=resource.id, prior_tags=resource.tags or {}, new_tags=changed_tags)
+    event = dict(resource_id=resource.id, old_tags={tag: (resource.tags or {}).get(tag) for tag in changed_tags}, new_tags=changed_tags,
+                 latency_ms=elapsed_ms(stats['started']), status=stats.get('status'), retries=stats.get('retries'))
     try:
-        resources = client.resources.list_by_resource_group(resource_group_name)
-        if resource_type:
-            resource = next((res for res in resources if res.name == resource_name and res.type == resource_type), None)
+        response = future.result()
+        if response:
+            log_and_print(f"Successfully updated tags for resource: '{resource_name}'. Updated tags: {changed_tags}")
+            with count_lock:
+                successful_updates_count += 1
+            journal.record(key, 'succeeded', **entry)
+            event_log.record('update_tags', outcome='succeeded', **event)
         else:
-            resource = next((res for res in resources if res.name == resource_name), None)
+            log_and_print(f"Failed to update tags for resource: '{resource_name}'. No response from Azure.")
+            journal.record(key, 'failed', error="No response from Azure", **entry)
+            event_log.record('update_tags', outcome='failed', error="No response from Azure", **event)
+    except Exception as e:
+        log_and_print(f"Failed to update tags for resource: '{resource_name}'. Error: {str(e)}")
+        journal.record(key, 'failed', error=str(e), **entry)
+        event_log.record('update_tags', level=logging.ERROR, outcome='failed', error=str(e), **event)
+    finally:
+        finished_updates.release()
+
+# Iterate through each row of the sheet
+for row in metrics.timed('read_row', read_rows(excel_file, log=log_and_print)):
+    subscription_id = row.subscription_id
+    resource_group_name = row.resource_group_name
+    resource_name = row.resource_name
+    resource_type = row.resource_type
+    resource_id = row.resource_id  # Optional column, skips the resource group lookup
+    if resource_id:
+        subscription_id, resource_group_name, _ = parse_resource_id(resource_id)
+        resource_name = resource_name or resource_id.rstrip('/').split('/')[-1]
+    tags = row_tags(row)
+    key = row_key(row.subscription_id, row.resource_group_name, row.resource_name, row.resource_type, row.resource_id)
+    if key in completed_rows:
+        continue
+
+    # Get the resource by ID, or by name and type if provided
+    try:
+        with metrics.span('lookup'):
+            if resource_id:
+                resource = lookup.get_by_id(resource_id)
+            else:
+                resource = lookup.find(subscription_id, resource_group_name, resource_name, resource_type)
 
         if resource is None:
             log_and_print(f"Resource '{resource_name}' {'of type ' + resource_type if resource_type else ''} not found in resource group '{resource_group_name}'")
+            journal.record(key, 'not_found', row=row.row_number)
+            event_log.record('update_tags', key=key, outcome='not_found')
+            continue
+        if not type_filter.allows(resource.type):
+            log_and_print(f"Skipping resource '{resource_name}' of excluded type '{resource.type}'")
+            journal.record(key, 'excluded', row=row.row_number, resource_id=resource.id)
+            event_log.record('update_tags', resource_id=resource.id, outcome='excluded')
             continue
     except Exception as e:
         log_and_print(f"Failed to get resource: '{resource_name}' {'of type ' + resource_type if resource_type else ''} in resource group '{resource_group_name}'. Error: {str(e)}")
+        journal.record(key, 'failed', row=row.row_number, error=str(e))
+        event_log.record('get_resource', key=key, outcome='failed', status=getattr(e, 'status_code', None), error=str(e))
         continue
 
     resource_tags = resource.tags if resource.tags else {}
@@ -70,52 +149,27 @@ for index, row in df.iterrows():
 
     if resource_tags != updated_tags:
         log_and_print(f"Updating tags for resource: '{resource_name}' in '{resource_group_name}' from '{subscription_id}' subscription.")
-        try:
-            # Get the API version for the resource
-            provider_namespace, resource_type_name = resource.type.split('/', 1)
-            resource_provider = client.providers.get(provider_namespace)
-            resource_type_info = next((rt for rt in resource_provider.resource_types if rt.resource_type == resource_type_name), None)
-            if resource_type_info is None:
-                log_and_print(f"Resource type '{resource_type_name}' not found for provider '{provider_namespace}'")
-                continue
-            api_version = resource_type_info.api_versions[0]
-
-            # Ensure properties is not None
-            resource_properties = resource.properties if resource.properties else {}
-
-            # Ensure SKU is not None if it is required
-            resource_sku = resource.sku if resource.sku else None
-
-            # Create a GenericResource object with the necessary parameters
-            generic_resource = GenericResource(
-                location=resource.location,
-                tags=updated_tags,
-                properties=resource_properties,
-                sku=resource_sku
-            )
-
-            # Log detailed information
-            log_and_print(f"Resource ID: {resource.id}")
-            log_and_print(f"API Version: {api_version}")
-            log_and_print(f"Generic Resource: {generic_resource}")
-
-            # Attempt to update the resource with new tags
-            response = client.resources.begin_update_by_id(
-                resource.id,
-                api_version,
-                parameters=generic_resource
-            ).result()
-
-            if response:
-                updated_tags_diff = {key: updated_tags[key] for key in tags.keys() if updated_tags[key] != resource_tags.get(key)}
-                log_and_print(f"Successfully updated tags for resource: '{resource_name}'. Updated tags: {updated_tags_diff}")
-                successful_updates_count += 1
-            else:
-                log_and_print(f"Failed to update tags for resource: '{resource_name}'. No response from Azure.")
-        except Exception as e:
-            log_and_print(f"Failed to update tags for resource: '{resource_name}'. Error: {str(e)}")
+        # Only the changed tags are sent; AZ_TAG_WRITE_MODE=resource updates the whole resource instead
+        changed_tags = {key: value for key, value in tags.items() if resource_tags.get(key) != value}
+        log_and_print(f"Resource ID: {resource.id}")
+        client = lookup.get_client(subscription_id)
+        start_update = partial(tag_writer.begin_update, client, resource, changed_tags, full_resource=True)
+        journal.record(key, 'pending', row=row.row_number, resource_id=resource.id, prior_tags=resource_tags, new_tags=changed_tags)
+        stats = {'started': time.perf_counter()}
+        future = executor.submit(subscription_id, partial(lro_scheduler.begin, client, start_update), stats=stats)
+        submitted_updates += 1
+        future.add_done_callback(partial(record_outcome, key, row.row_number, resource, resource_name, changed_tags, stats))
     else:
         log_and_print(f"Tags for resource '{resource_name}' are already up to date.")
+        journal.record(key, 'unchanged', row=row.row_number, resource_id=resource.id)
+        event_log.record('update_tags', resource_id=resource.id, outcome='unchanged')
+
+# Wait until the outcome of every update is journaled
+for _ in range(submitted_updates):
+    finished_updates.acquire()
+executor.shutdown()
+journal.close()
 
 log_and_print(f"Task Completed")
 log_and_print(f"Number of resources with successful tag updates: {successful_updates_count}")
+metrics.finish(log=log_and_print)
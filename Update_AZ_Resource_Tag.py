@@ -1,24 +1,51 @@
 import os
+import sys
 import logging
+import argparse
 from datetime import datetime
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
+from az_daemon_client import forward
+
+parser = argparse.ArgumentParser(description="Update the tags of one resource. Values not given as arguments are prompted for.")
+parser.add_argument('--subscription', help="Subscription ID")
+parser.add_argument('--resource-group', help="Resource group name")
+parser.add_argument('--name', help="Resource name or resource ID")
+parser.add_argument('--owner')
+parser.add_argument('--application')
+parser.add_argument('--environment')
+parser.add_argument('--cost-center')
+args = parser.parse_args()
+# Only prompt for tags when none were given on the command line
+prompt_tags = not any([args.owner, args.application, args.environment, args.cost_center])
+
+def argument_or_input(value, prompt, ask=True):
+    return value if value is not None or not ask else input(prompt)
 
 # Parameters
-subscription_input = input("Enter the subscription ID: ")
-resource_group_name = input("Enter the resource group name: ")
-resource_name = input("Enter the resource name: ")
-owner_tag = input("Enter the owner tag value: ")
-application_tag = input("Enter the application tag value: ")
-environment_tag = input("Enter the environment tag value: ")
-cost_center_tag = input("Enter the cost-center tag value: ")
+subscription_input = argument_or_input(args.subscription, "Enter the subscription ID: ")
+resource_group_name = argument_or_input(args.resource_group, "Enter the resource group name: ")
+resource_name = argument_or_input(args.name, "Enter the resource name: ")
+owner_tag = argument_or_input(args.owner, "Enter the owner tag value: ", prompt_tags)
+application_tag = argument_or_input(args.application, "Enter the application tag value: ", prompt_tags)
+environment_tag = argument_or_input(args.environment, "Enter the environment tag value: ", prompt_tags)
+cost_center_tag = argument_or_input(args.cost_center, "Enter the cost-center tag value: ", prompt_tags)
 
-tags = {
+tags = {key: value for key, value in {
     "owner": owner_tag,
     "application": application_tag,
     "environment": environment_tag,
     "cost-center": cost_center_tag
-}
+}.items() if value is not None}
+
+# A running az_daemon.py does the update with its credential and caches already warm
+daemon_job = forward('update', subscription_id=subscription_input, resource_group=resource_group_name, resource_name=resource_name, tags=tags)
+if daemon_job:
+    sys.exit(0 if daemon_job['status'] == 'succeeded' else 1)
+
+# Imported only when the update runs in this process
+from az_session import azure_session
+from az_resource_lookup import ResourceLookup
+from az_tag_writer import TagWriter, update_resource_tags
+from az_tag_journal import TagJournal, journal_path
 
 # Set the default log directory to the user's home directory
 log_directory = os.path.join(os.path.expanduser("~"), "ResourceTagLogs")
@@ -33,43 +60,26 @@ def log_and_print(message):
     print(message)
     logging.info(message)
 
-# Authenticate to Azure
-credential = DefaultAzureCredential()
-client = ResourceManagementClient(credential, subscription_input)
-
-# Get the specific resource in the resource group
-resources = client.resources.list_by_resource_group(resource_group_name)
-resource = next((r for r in resources if r.name == resource_name), None)
+tag_writer = TagWriter(log=log_and_print)
 
-if resource:
-    resource_id = resource.id
-    resource_tags = resource.tags if resource.tags else {}
-    updated_tags = {**resource_tags, **tags}
+# Prior tags are journaled so the update can be undone with az_tag_rollback.py
+journal = TagJournal(journal_path('single_updates'))
+journal.start()
 
-    # Get the appropriate API version for the resource type
-    resource_provider_namespace = resource.type.split('/')[0]
-    resource_type = resource.type.split('/')[1]
-    provider = client.providers.get(resource_provider_namespace)
-    resource_type_obj = next((rt for rt in provider.resource_types if rt.resource_type == resource_type), None)
-    if resource_type_obj:
-        api_version = resource_type_obj.api_versions[0]  # Use the latest API version
-    else:
-        log_and_print(f"Could not find resource type '{resource_type}' for provider '{resource_provider_namespace}'")
-        api_version = None
+# Authenticate to Azure
+azure_session.authenticate(log=log_and_print)
 
-    if api_version and resource_tags != updated_tags:
-        log_and_print(f"Updating tags for resource: '{resource.name}' in '{resource_group_name}' from '{subscription_input}' subscription.")
-        try:
-            client.resources.begin_update_by_id(
-                resource_id=resource_id,
-                api_version=api_version,
-                parameters={"tags": updated_tags}
-            ).result()
-            updated_tags_diff = {key: updated_tags[key] for key in tags.keys() if updated_tags[key] != resource_tags.get(key)}
-            log_and_print(f"Successfully updated tags for resource: '{resource.name}'. Updated tags: {updated_tags_diff}")
-        except Exception as e:
-            log_and_print(f"Failed to update tags for resource: '{resource.name}'. Error: {str(e)}")
-else:
-    log_and_print(f"Resource '{resource_name}' not found in resource group '{resource_group_name}'.")
+# The resource is read by ID (resource_name may be a pasted ID) or found with a $filter name query.
+# Only the changed tags are sent; AZ_TAG_WRITE_MODE=resource updates the whole resource instead.
+succeeded = False
+try:
+    update_resource_tags(ResourceLookup(), subscription_input, resource_group_name, resource_name, tags, journal, tag_writer, log=log_and_print)
+    succeeded = True
+except LookupError as e:
+    log_and_print(str(e))
+except Exception as e:
+    log_and_print(f"Failed to update tags for resource: '{resource_name}'. Error: {str(e)}")
 
+journal.close()
 log_and_print("Task Completed")
+sys.exit(0 if succeeded else 1)
@@ -1,154 +1,249 @@
 import os
+import queue
 import logging
+import logging.handlers
 from datetime import datetime
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.resource import ResourceManagementClient
 from azure.core.exceptions import ClientAuthenticationError
 import tkinter as tk
 from tkinter import messagebox, ttk
 import threading
-import time
-from PIL import Image, ImageTk
+from functools import partial
+from concurrent.futures import wait
+from az_tag_writer import tag_writer
+from az_lro import lro_scheduler
+from az_session import azure_session
+from az_resource_lookup import ResourceLookup, parse_resource_id
+from az_resource_index import ResourceIndex, latest_inventory, FULL_EXPORT_HINT
+from az_tag_journal import TagJournal, journal_path, row_key
+from az_tag_rollback import TagRollback
+from az_event_log import event_log
+from az_icons import load_icons
 
 # Global variables
 cancel_flag = False
-rollback_tags = None
+rollback_entry = None
 resource = None
 
-def authenticate_to_azure():
+# Resources are resolved by ID from the latest inventory export, falling back to a $filter query by name
+lookup = ResourceLookup()
+resource_index = ResourceIndex()
+
+def load_resource_index():
+    global resource_index
+    if latest_inventory() is None:
+        print(FULL_EXPORT_HINT)
+        return
+    try:
+        resource_index = ResourceIndex.from_inventory()
+    except Exception as e:
+        print(f"Could not load the inventory index: {e}")
+
+threading.Thread(target=load_resource_index, daemon=True).start()
+
+# Every update is journaled with the prior tags; az_tag_rollback.py can undo a whole session
+journal = TagJournal(journal_path('gui_updates'))
+journal.start()
+
+def authenticate_to_azure(subscription_id):
+    # The session keeps the credential, its tokens and one client per subscription between button presses
     try:
-        credential = DefaultAzureCredential()
-        client = ResourceManagementClient(credential, subscription_id_entry.get())
-        list(client.resources.list_by_resource_group(resource_group_entry.get()))
-        return client
+        azure_session.validate()
+        return azure_session.get_client(subscription_id)
     except ClientAuthenticationError:
         log_and_print("Authentication failed. Please re-authenticate.")
+        azure_session.reset()
     except Exception as e:
         log_and_print(f"Error during authentication: {e}")
+        azure_session.reset()
+
+# Worker threads never touch widgets: log lines and UI calls go through ui_queue, which the Tk main loop
+# drains in batches every LOG_PUMP_INTERVAL_MS. The pane keeps the last LOG_PANE_MAX_LINES lines, the
+# log file has everything.
+LOG_PANE_MAX_LINES = int(os.environ.get('AZ_GUI_LOG_LINES', 2000))
+LOG_PUMP_INTERVAL_MS = 100
+LOG_PUMP_BATCH = 500
+LOG_FILE_FLUSH_MS = 1000
+ui_queue = queue.Queue()
+log_listener = None
+log_file_buffer = None
 
 def log_and_print(message):
     print(message)
     logging.info(message)
+    ui_queue.put(('log', message + '\n', 'message'))
+
+def on_ui(function, *args, **kwargs):
+    ui_queue.put(('call', function, args, kwargs))
+
+def pump_ui_queue():
+    lines = []
+    for _ in range(LOG_PUMP_BATCH):
+        try:
+            item = ui_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item[0] == 'log':
+            lines.extend(item[1:])
+        else:
+            write_log_pane(lines)
+            lines = []
+            try:
+                item[1](*item[2], **item[3])
+            except Exception as e:
+                print(f"UI update failed: {e}")
+    write_log_pane(lines)
+    root.after(LOG_PUMP_INTERVAL_MS, pump_ui_queue)
+
+def write_log_pane(lines):
+    # lines alternates text and tag, so the whole batch is a single insert
+    if not lines:
+        return
     log_textbox.config(state=tk.NORMAL)
-    log_textbox.insert(tk.END, message + '\n', 'message')
+    log_textbox.insert(tk.END, *lines)
+    excess = int(log_textbox.index('end-1c').split('.')[0]) - LOG_PANE_MAX_LINES
+    if excess > 0:
+        log_textbox.delete('1.0', f'{excess + 1}.0')
     log_textbox.see(tk.END)
     log_textbox.config(state=tk.DISABLED)
 
 def configure_logging():
+    # Records are queued by the logging call and written to the file by a listener thread, in batches
+    global log_listener, log_file_buffer
+    if log_listener:
+        return
     log_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
     if not os.path.exists(log_directory):
         os.makedirs(log_directory)
     
     log_file_path = os.path.join(log_directory, f"Update_AZ_Resource_Tag_{datetime.now().strftime('%m_%d_%Y')}.log")
-    logging.basicConfig(filename=log_file_path, level=logging.INFO, format='%(asctime)s - %(message)s')
+    file_handler = logging.FileHandler(log_file_path)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    log_file_buffer = logging.handlers.MemoryHandler(200, flushLevel=logging.ERROR, target=file_handler)
+    log_queue = queue.Queue()
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+    logging.getLogger().setLevel(logging.INFO)
+    log_listener = logging.handlers.QueueListener(log_queue, log_file_buffer)
+    log_listener.start()
+    flush_log_file()
+
+def flush_log_file():
+    log_file_buffer.flush()
+    root.after(LOG_FILE_FLUSH_MS, flush_log_file)
 
 def update_tags():
     global cancel_flag
     cancel_flag = False
 
+    subscription_id, resource_group_name, resource_name = subscription_id_entry.get(), resource_group_entry.get(), resource_name_entry.get()
+    tags = {k: v for k, v in {"owner": owner_tag_entry.get(), "application": application_tag_entry.get(),
+                              "environment": environment_tag_entry.get(), "cost-center": cost_center_tag_entry.get()}.items() if v}
+
     def run_update():
-        global rollback_tags, resource
-        client = authenticate_to_azure()
+        global resource
+        client = authenticate_to_azure(subscription_id)
         if not client:
-            messagebox.showerror("Authentication Error", "Failed to authenticate to Azure. Please check your credentials.")
-            finalize_task("Authentication Error")
+            on_ui(messagebox.showerror, "Authentication Error", "Failed to authenticate to Azure. Please check your credentials.")
+            on_ui(finalize_task, "Authentication Error")
             return
 
-        configure_logging()
-        resource_group_name, resource_name = resource_group_entry.get(), resource_name_entry.get()
-        tags = {k: v for k, v in {"owner": owner_tag_entry.get(), "application": application_tag_entry.get(),
-                                  "environment": environment_tag_entry.get(), "cost-center": cost_center_tag_entry.get()}.items() if v}
-
         try:
-            resource = next((r for r in client.resources.list_by_resource_group(resource_group_name) if r.name == resource_name), None)
+            resource = lookup.resolve(subscription_id, resource_group_name, resource_name, resource_index)
             if resource:
-                resource_id, resource_tags = resource.id, resource.tags or {}
+                resource_tags = resource.tags or {}
                 updated_tags = {**resource_tags, **tags}
 
                 log_and_print(f"Current tags for resource '{resource_name}': {resource_tags}")
                 if resource_tags != updated_tags:
                     log_and_print(f"Updating tags for resource: '{resource.name}'")
-                    rollback_tags = resource_tags.copy()
                     if cancel_flag:
                         log_and_print("Update cancelled before execution.")
                         return
 
-                    api_version = get_api_version(client, resource)
-                    if api_version:
-                        perform_update(client, resource_id, api_version, updated_tags, resource_name)
-                    else:
-                        log_and_print(f"Could not find API version for resource '{resource_name}'")
+                    perform_update(client, resource, updated_tags, resource_name, row_key(subscription_id, resource_group_name, resource_name))
                 else:
                     log_and_print("Tags are already up-to-date. No update required.")
                     display_tags(resource_tags)
-                    messagebox.showinfo("Info", "Tags are already up-to-date. No update required.")
+                    on_ui(messagebox.showinfo, "Info", "Tags are already up-to-date. No update required.")
             else:
                 log_and_print(f"Resource '{resource_name}' not found in resource group '{resource_group_name}'")
-                messagebox.showerror("Error", f"Resource '{resource_name}' not found in resource group '{resource_group_name}'")
+                on_ui(messagebox.showerror, "Error", f"Resource '{resource_name}' not found in resource group '{resource_group_name}'")
 
         except Exception as e:
             log_and_print(f"Error during resource retrieval or update: {e}")
-            messagebox.showerror("Error", f"Error during resource retrieval or update: {e}")
+            on_ui(messagebox.showerror, "Error", f"Error during resource retrieval or update: {e}")
 
-        finalize_task("Task Completed")
+        on_ui(finalize_task, "Task Completed")
 
     start_task(run_update, "Updating tags...")
 
-def perform_update(client, resource_id, api_version, updated_tags, resource_name):
+def perform_update(client, resource, updated_tags, resource_name, key):
+    global rollback_entry
+    changed_tags = {key: value for key, value in updated_tags.items() if (resource.tags or {}).get(key) != value}
+    entry = dict(resource_id=resource.id, prior_tags=resource.tags or {}, new_tags=changed_tags)
     try:
-        update_operation = client.resources.begin_update_by_id(resource_id=resource_id, api_version=api_version, parameters={"tags": updated_tags})
-        while not update_operation.done():
-            if cancel_flag:
-                log_and_print("Update cancelled during execution.")
-                update_operation.cancel()
-                return
-            time.sleep(1)
-        update_operation.result()
+        journal.record(key, 'pending', **entry)
+        with event_log.operation('update_tags', resource_id=resource.id, old_tags={tag: (resource.tags or {}).get(tag) for tag in changed_tags}, new_tags=changed_tags) as event:
+            update_operation = lro_scheduler.begin(client, partial(tag_writer.begin_update, client, resource, changed_tags))
+            while not update_operation.done():
+                if cancel_flag:
+                    log_and_print("Update cancelled during execution.")
+                    update_operation.cancel()
+                    event['outcome'] = 'cancelled'
+                    return
+                wait([update_operation], timeout=1)
+            update_operation.result()
+        journal.record(key, 'succeeded', **entry)
+        rollback_entry = dict(entry, key=key)
         log_and_print(f"Successfully updated tags for resource: '{resource_name}'\nUpdated tags: {updated_tags}")
         display_tags(updated_tags)
-        populate_input_fields(updated_tags)
-        messagebox.showinfo("Success", f"Successfully updated tags for resource: '{resource_name}'")
-        rollback_button.config(state=tk.NORMAL)
+        on_ui(populate_input_fields, updated_tags)
+        on_ui(messagebox.showinfo, "Success", f"Successfully updated tags for resource: '{resource_name}'")
+        on_ui(rollback_button.config, state=tk.NORMAL)
     except Exception as e:
         log_and_print(f"Failed to update tags for resource: '{resource_name}'. Error: {str(e)}")
-        rollback_update()
-        messagebox.showerror("Error", f"Failed to update tags for resource: '{resource_name}'. Error: {str(e)}")
+        journal.record(key, 'failed', error=str(e), **entry)
+        # The write may still have gone through; the rollback skips the resource if it did not
+        rollback_entry = dict(entry, key=key)
+        on_ui(rollback_update)
+        on_ui(messagebox.showerror, "Error", f"Failed to update tags for resource: '{resource_name}'. Error: {str(e)}")
 
 def rollback_update():
-    if rollback_tags and resource:
+    if rollback_entry and resource:
+        subscription_id = parse_resource_id(rollback_entry['resource_id'])[0]
+
         def run_rollback():
-            client = authenticate_to_azure()
+            global rollback_entry
+            client = authenticate_to_azure(subscription_id)
             if not client:
-                messagebox.showerror("Authentication Error", "Failed to authenticate to Azure. Please check your credentials.")
-                finalize_task("Authentication Error")
+                on_ui(messagebox.showerror, "Authentication Error", "Failed to authenticate to Azure. Please check your credentials.")
+                on_ui(finalize_task, "Authentication Error")
                 return
 
-            configure_logging()
-
+            rollback_journal = TagJournal(journal_path('rollback'))
+            rollback_journal.start()
+            engine = TagRollback(azure_session.get_client, journal=rollback_journal, log=log_and_print)
             try:
-                api_version = get_api_version(client, resource)
-                if api_version:
-                    log_and_print(f"Rolling back tags for resource: '{resource.name}'")
-                    rollback_operation = client.resources.begin_update_by_id(resource_id=resource.id, api_version=api_version, parameters={"tags": rollback_tags})
-                    while not rollback_operation.done():
-                        if cancel_flag:
-                            log_and_print("Rollback cancelled during execution.")
-                            rollback_operation.cancel()
-                            return
-                        time.sleep(1)
-                    rollback_operation.result()
+                log_and_print(f"Rolling back tags for resource: '{resource.name}'")
+                counts = engine.rollback([rollback_entry], cancelled=lambda: cancel_flag)
+                if counts['reverted']:
+                    rollback_entry = None
+                    rolled_back_tags = client.tags.get_at_scope(resource.id).properties.tags or {}
                     log_and_print(f"Successfully rolled back tags for resource: '{resource.name}'")
-                    display_tags(rollback_tags)
-                    populate_input_fields(rollback_tags)
-                    messagebox.showinfo("Success", f"Successfully rolled back tags for resource: '{resource.name}'")
-                else:
-                    log_and_print("Failed to get API version. Cannot rollback.")
-                    messagebox.showerror("Error", "Failed to get API version. Cannot rollback.")
+                    display_tags(rolled_back_tags)
+                    on_ui(populate_input_fields, rolled_back_tags)
+                    on_ui(messagebox.showinfo, "Success", f"Successfully rolled back tags for resource: '{resource.name}'")
+                elif counts['drifted']:
+                    on_ui(messagebox.showwarning, "Rollback Skipped", f"Tags of resource '{resource.name}' changed since the update; rollback skipped.")
+                elif counts['failed']:
+                    on_ui(messagebox.showerror, "Error", f"Failed to rollback tags for resource: '{resource.name}'")
             except Exception as e:
                 log_and_print(f"Failed to rollback tags: {str(e)}")
-                messagebox.showerror("Error", f"Failed to rollback tags: {str(e)}")
+                on_ui(messagebox.showerror, "Error", f"Failed to rollback tags: {str(e)}")
+            finally:
+                engine.shutdown()
+                rollback_journal.close()
 
-            finalize_task("Rollback Completed")
+            on_ui(finalize_task, "Rollback Completed")
 
         start_task(run_rollback, "Rolling back tags...")
 
@@ -156,45 +251,34 @@ def pull_resource_tags():
     global cancel_flag
     cancel_flag = False
 
+    subscription_id, resource_group_name, resource_name = subscription_id_entry.get(), resource_group_entry.get(), resource_name_entry.get()
+
     def run_pull():
-        client = authenticate_to_azure()
+        client = authenticate_to_azure(subscription_id)
         if not client:
-            messagebox.showerror("Authentication Error", "Failed to authenticate to Azure. Please check your credentials.")
-            finalize_task("Authentication Error")
+            on_ui(messagebox.showerror, "Authentication Error", "Failed to authenticate to Azure. Please check your credentials.")
+            on_ui(finalize_task, "Authentication Error")
             return
 
-        configure_logging()
-        resource_group_name, resource_name = resource_group_entry.get(), resource_name_entry.get()
-
         try:
-            resource = next((r for r in client.resources.list_by_resource_group(resource_group_name) if r.name == resource_name), None)
+            resource = lookup.resolve(subscription_id, resource_group_name, resource_name, resource_index)
             if resource:
                 resource_tags = resource.tags or {}
                 log_and_print(f"Current tags for resource '{resource_name}': {resource_tags}")
                 display_tags(resource_tags)
-                populate_input_fields(resource_tags)
-                messagebox.showinfo("Success", f"Successfully pulled tags for resource: '{resource.name}'")
+                on_ui(populate_input_fields, resource_tags)
+                on_ui(messagebox.showinfo, "Success", f"Successfully pulled tags for resource: '{resource.name}'")
             else:
                 log_and_print(f"Resource '{resource_name}' not found in resource group '{resource_group_name}'")
-                messagebox.showerror("Error", f"Resource '{resource_name}' not found in resource group '{resource_group_name}'")
+                on_ui(messagebox.showerror, "Error", f"Resource '{resource_name}' not found in resource group '{resource_group_name}'")
         except Exception as e:
             log_and_print(f"Error during resource retrieval: {e}")
-            messagebox.showerror("Error", f"Error during resource retrieval: {e}")
+            on_ui(messagebox.showerror, "Error", f"Error during resource retrieval: {e}")
 
-        finalize_task("Pull Task Completed")
+        on_ui(finalize_task, "Pull Task Completed")
 
     start_task(run_pull, "Pulling tags...")
 
-def get_api_version(client, resource):
-    try:
-        namespace, r_type = resource.type.split('/')
-        provider = client.providers.get(namespace)
-        r_type_obj = next((rt for rt in provider.resource_types if rt.resource_type == r_type), None)
-        return r_type_obj.api_versions[0] if r_type_obj else None
-    except Exception as e:
-        log_and_print(f"Error getting API version: {e}")
-        return None
-
 def start_task(target, progress_text):
     disable_buttons(during_update=True)
     # cancel_button.config(state=tk.NORMAL)  # Commented out
@@ -218,6 +302,10 @@ def clear_inputs():
     disable_buttons()
 
 def close_application():
+    journal.close()
+    if log_listener:
+        log_listener.stop()
+        log_file_buffer.close()
     root.destroy()
 
 def disable_buttons(during_update=False):
@@ -234,7 +322,7 @@ def enable_buttons():
     update_button.config(state=state)
     pull_button.config(state=state)
     clear_button.config(state=state)
-    rollback_button.config(state=tk.NORMAL if rollback_tags else state)
+    rollback_button.config(state=tk.NORMAL if rollback_entry else state)
     # cancel_button.config(state=tk.DISABLED)  # Commented out
     close_button.config(state=tk.NORMAL)
 
@@ -242,12 +330,10 @@ def disable_close():
     pass
 
 def display_tags(tags):
-    log_textbox.config(state=tk.NORMAL)
-    log_textbox.insert(tk.END, "Tags:\n", 'header')
+    lines = ["Tags:\n", 'header']
     for key, value in tags.items():
-        log_textbox.insert(tk.END, f"{key}: {value}\n", 'message')
-    log_textbox.see(tk.END)
-    log_textbox.config(state=tk.DISABLED)
+        lines += [f"{key}: {value}\n", 'message']
+    ui_queue.put(('log', *lines))
 
 def populate_input_fields(tags):
     for entry, key in [(owner_tag_entry, "owner"), (application_tag_entry, "application"), 
@@ -269,26 +355,31 @@ x, y = (root.winfo_screenwidth() // 2) - (width // 2), (root.winfo_screenheight(
 root.geometry(f'{width}x{height}+{x}+{y}')
 root.protocol("WM_DELETE_WINDOW", disable_close)
 
-def load_icon(path):
-    return ImageTk.PhotoImage(Image.open(path).resize((20, 20), Image.LANCZOS))
-
-icons = {name: load_icon(os.path.join("icons", f"{name}.jpg")) for name in ["update", "clear", "update", "rollback", "close", "pull"]}
-
-def create_label_and_entry(row, label_text, variable):
+def create_label_and_entry(row, label_text, variable, completion=False):
     tk.Label(root, text=label_text).grid(row=row, column=0, padx=5, pady=2, sticky="e")
-    entry = tk.Entry(root, textvariable=variable)
+    entry = ttk.Combobox(root, textvariable=variable) if completion else tk.Entry(root, textvariable=variable)
     entry.grid(row=row, column=1, padx=5, pady=2, sticky="w")
     return entry
 
 variables = {name: tk.StringVar() for name in ["subscription_id", "resource_group", "resource_name", "owner_tag", "application_tag", "environment_tag", "cost_center_tag"]}
-entries = [create_label_and_entry(i, label, variables[name]) for i, (name, label) in enumerate([
+entries = [create_label_and_entry(i, label, variables[name], completion=i < 3) for i, (name, label) in enumerate([
     ("subscription_id", "Subscription ID:"), ("resource_group", "Resource Group Name:"), ("resource_name", "Resource Name:"),
     ("owner_tag", "Owner Tag Value:"), ("application_tag", "Application Tag Value:"), ("environment_tag", "Environment Tag Value:"),
     ("cost_center_tag", "Cost-center Tag Value:")])]
 subscription_id_entry, resource_group_entry, resource_name_entry, owner_tag_entry, application_tag_entry, environment_tag_entry, cost_center_tag_entry = entries
 
+def update_completions(event=None):
+    # Suggestions come from the inventory index, no network round trip
+    subscription_id, resource_group = subscription_id_entry.get(), resource_group_entry.get()
+    subscription_id_entry['values'] = resource_index.complete_subscription(subscription_id)
+    resource_group_entry['values'] = resource_index.complete_resource_group(subscription_id, resource_group)
+    resource_name_entry['values'] = resource_index.complete_resource_name(subscription_id, resource_group, resource_name_entry.get())
+
 for entry in [subscription_id_entry, resource_group_entry, resource_name_entry]:
     entry.bind("<KeyRelease>", validate_input_fields)
+    entry.bind("<KeyRelease>", update_completions, add="+")
+    entry.bind("<<ComboboxSelected>>", validate_input_fields)
+    entry.bind("<<ComboboxSelected>>", update_completions, add="+")
 
 for widget in root.winfo_children():
     widget.grid_configure(sticky="ew")
@@ -298,6 +389,8 @@ button_frame.grid(row=7, column=0, columnspan=2, pady=(20, 5))
 
 button_config = [("Update Tags", update_tags, "update"), ("Pull Resource Tags", pull_resource_tags, "pull"), 
                  ("Clear Inputs", clear_inputs, "clear"), ("Rollback Tags", rollback_update, "rollback"), ("Close", close_application, "close")]
+# Pre-sized icons from the cache, each loaded once
+icons = load_icons(icon for _, _, icon in button_config)
 buttons = {text: tk.Button(button_frame, text=text, command=command, state=tk.DISABLED if text != "Close" else tk.NORMAL, image=icons[icon], compound=tk.LEFT) 
            for text, command, icon in button_config}
 for i, button in enumerate(buttons.values()):
@@ -326,4 +419,6 @@ root.grid_rowconfigure(10, weight=1)
 root.grid_columnconfigure(0, weight=1)
 root.grid_columnconfigure(1, weight=1)
 
+configure_logging()
+pump_ui_queue()
 root.mainloop()
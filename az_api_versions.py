@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from az_cache import cache_path
+from az_metrics import metrics
+
+API_VERSION_TTL = 7 * 24 * 3600
+API_VERSION_MAX_ENTRIES = 5000
+
+
+def pick_api_version(api_versions):
+    # Versions look like '2023-01-01' or '2023-01-01-preview'; prefer the newest without a suffix
+    stable = [v for v in api_versions if v.count('-') == 2]
+    candidates = stable or list(api_versions)
+    return max(candidates) if candidates else None
+
+
+class ApiVersionResolver:
+    # Memoizes provider API versions per (subscription, namespace, type) in a JSON file with a TTL and LRU eviction
+    def __init__(self, path=None, ttl=API_VERSION_TTL, max_entries=API_VERSION_MAX_ENTRIES):
+        self.path = path or cache_path('api_versions.json')
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.warmed = set()
+        self.entries = OrderedDict()
+        try:
+            with open(self.path) as cache_file:
+                self.entries.update(json.load(cache_file))
+        except (OSError, ValueError):
+            pass
+
+    def key(self, subscription_id, resource_type):
+        namespace, type_name = resource_type.split('/', 1)
+        return f"{subscription_id}|{namespace}|{type_name}".lower()
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def store(self, subscription_id, provider):
+        now = time.time()
+        for resource_type in provider.resource_types or []:
+            version = pick_api_version(resource_type.api_versions or [])
+            if version:
+                key = self.key(subscription_id, f"{provider.namespace}/{resource_type.resource_type}")
+                self.entries[key] = [version, now]
+                self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        # A temporary file of its own per save, so processes sharing the cache never write into each other's copy
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(self.path), prefix=os.path.basename(self.path) + '.', suffix='.tmp', delete=False) as cache_file:
+            json.dump(self.entries, cache_file)
+        os.replace(cache_file.name, self.path)
+
+    def warm(self, client, subscription_id):
+        # One providers.list() call fills every namespace of the subscription
+        providers = list(client.providers.list())
+        with self.lock:
+            for provider in providers:
+                self.store(subscription_id, provider)
+            self.warmed.add(subscription_id.lower())
+            self.save()
+
+    def get(self, client, subscription_id, resource_type):
+        with metrics.span('provider_resolution'):
+            return self.resolve(client, subscription_id, resource_type)
+
+    def resolve(self, client, subscription_id, resource_type):
+        key = self.key(subscription_id, resource_type)
+        with self.lock:
+            entry = self.lookup(key)
+            if entry is not None:
+                return entry[0]
+            warmed = subscription_id.lower() in self.warmed
+        if warmed:
+            provider = client.providers.get(resource_type.split('/', 1)[0])
+            with self.lock:
+                self.store(subscription_id, provider)
+                self.save()
+        else:
+            self.warm(client, subscription_id)
+        with self.lock:
+            entry = self.lookup(key)
+            return entry[0] if entry else None
+
+
+api_versions = ApiVersionResolver()
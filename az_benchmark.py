@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import tempfile
+import subprocess
+import pandas as pd
+from az_fake_server import generate_resources, serve
+
+# Offline benchmarks of the export pipeline and the bulk tag updater against az_fake_server. Each case runs
+# in its own process (so peak RSS is its own) while the fake server stays in this one and counts the calls.
+# Results are compared with the stored baselines and the script exits with 1 when a case regressed.
+BENCHMARK_CASES = ['export', 'bulk']
+BENCHMARK_SIZES = [1000, 10000, 100000]
+BENCHMARK_SUBSCRIPTIONS = ['00000000-0000-0000-0000-000000000001', '00000000-0000-0000-0000-000000000002']
+BASELINE_FILE = os.environ.get('AZ_BENCHMARK_BASELINES', 'benchmark_baselines.json')
+# Allowed slowdown / growth before a case counts as a regression
+REGRESSION_TOLERANCE = float(os.environ.get('AZ_BENCHMARK_TOLERANCE', 0.25))
+# Share of the bulk sheet's rows that change a tag
+CHANGED_SHARE = 0.5
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(share * len(values)))], 1)
+
+
+def peak_rss_mb():
+    import resource
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def write_sheet(resources, path):
+    rows = []
+    for i, resource in enumerate(resources):
+        tags = resource['tags']
+        rows.append({
+            'subscription_id': resource['subscriptionId'],
+            'resource_group_name': resource['resourceGroup'],
+            'resource_name': resource['name'],
+            'resource_type': resource['type'],
+            'owner_tag': f"benchmark-{i}" if i % round(1 / CHANGED_SHARE) == 0 else tags.get('owner'),
+            'application_tag': tags.get('application')
+        })
+    pd.DataFrame(rows).to_parquet(path, index=False)
+
+
+def run_export(workdir):
+    from az_export import InventoryExport
+    export = InventoryExport(log=lambda message: None)
+    export.subscription_ids = BENCHMARK_SUBSCRIPTIONS
+    # Measures the full inventory write, not the snapshot
+    export.configure(export_mode='full')
+    # Time between pages as seen by the pipeline, per subscription
+    latencies = []
+    list_pages = export.list_pages
+
+    def timed_pages(credential, subscription_id):
+        started = time.perf_counter()
+        for page in list_pages(credential, subscription_id):
+            latencies.append((time.perf_counter() - started) * 1000)
+            yield page
+            started = time.perf_counter()
+    export.list_pages = timed_pages
+    export.run()
+    return latencies
+
+
+def run_bulk(workdir):
+    sys.argv = ['Update_AZ_Multiple_Resource_Tag.py', os.path.join(workdir, 'sheet.parquet')]
+    with open(os.path.join(workdir, 'bulk.out'), 'w') as output:
+        stdout, sys.stdout = sys.stdout, output
+        try:
+            runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Update_AZ_Multiple_Resource_Tag.py'), run_name='__main__')
+        finally:
+            sys.stdout = stdout
+    from az_event_log import event_log, EVENT_LOG_FILE
+    event_log.stop()
+    with open(EVENT_LOG_FILE) as events:
+        return [event['latency_ms'] for event in map(json.loads, events)
+                if event.get('action') == 'update_tags' and event.get('latency_ms') is not None]
+
+
+def run_worker(case, workdir):
+    from az_fake_server import FakeCredential
+    from az_session import azure_session
+    os.chdir(workdir)
+    azure_session.use_credential(FakeCredential())
+    started = time.perf_counter()
+    latencies = run_export(workdir) if case == 'export' else run_bulk(workdir)
+    print(json.dumps({'seconds': time.perf_counter() - started, 'peak_rss_mb': peak_rss_mb(), 'latencies': latencies}))
+
+
+def run_case(case, size, options):
+    resources = generate_resources(size, BENCHMARK_SUBSCRIPTIONS)
+    server = serve(resources, max_page_size=options.page_size, latency=options.latency, throttle_rate=options.throttle_rate,
+                   error_rate=options.error_rate, lro_polls=options.lro_polls)
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"az_benchmark_{case}_") as workdir:
+            if case == 'bulk':
+                write_sheet(resources, os.path.join(workdir, 'sheet.parquet'))
+            env = {
+                **os.environ,
+                'HOME': workdir,
+                'AZ_ARM_ENDPOINT': server.url,
+                'AZ_RESOURCE_GRAPH_ENDPOINT': server.url,
+                'AZ_TAG_CACHE_DIR': os.path.join(workdir, 'cache'),
+                'AZ_TAG_JOURNAL_DIR': os.path.join(workdir, 'logs'),
+                'AZ_TAG_EVENT_LOG': os.path.join(workdir, 'logs', 'operations.jsonl'),
+                'AZ_TAG_WRITES_PER_SECOND': str(options.writes_per_second),
+                'AZ_TAG_WRITE_BURST': str(int(options.writes_per_second)),
+                'AZ_LRO_POLL_INTERVAL': '0.05',
+                'PYTHONPATH': os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), os.environ.get('PYTHONPATH')]))
+            }
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', case, workdir],
+                                       env=env, capture_output=True, text=True)
+            if completed.returncode:
+                raise RuntimeError(f"{case} benchmark with {size} resources failed:\n{completed.stderr[-2000:]}")
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        server.shutdown()
+    calls = {endpoint: count for endpoint, count in dict(server.arm.calls, resource_graph=server.resource_graph.calls).items() if count}
+    return {
+        'resources': size,
+        'seconds': round(result['seconds'], 2),
+        'resources_per_second': round(size / result['seconds'], 1),
+        'calls': sum(count for endpoint, count in calls.items() if endpoint not in ('throttled', 'server_errors')),
+        'calls_by_endpoint': calls,
+        'peak_rss_mb': result['peak_rss_mb'],
+        'p50_ms': percentile(result['latencies'], 0.5),
+        'p99_ms': percentile(result['latencies'], 0.99)
+    }
+
+
+def regressions(result, baseline, tolerance):
+    found = []
+    if result['resources_per_second'] < baseline['resources_per_second'] * (1 - tolerance):
+        found.append(f"throughput {result['resources_per_second']}/s < baseline {baseline['resources_per_second']}/s")
+    for metric in ['calls', 'peak_rss_mb', 'p99_ms']:
+        if result.get(metric) is not None and baseline.get(metric) and result[metric] > baseline[metric] * (1 + tolerance):
+            found.append(f"{metric} {result[metric]} > baseline {baseline[metric]}")
+    return found
+
+
+def load_baselines(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the export and bulk update scripts against the local fake Azure endpoint.")
+    parser.add_argument('--cases', nargs='+', choices=BENCHMARK_CASES, default=BENCHMARK_CASES)
+    parser.add_argument('--sizes', nargs='+', type=int, default=BENCHMARK_SIZES)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every fake ARM request")
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--lro-polls', type=int, default=1)
+    parser.add_argument('--writes-per-second', type=float, default=1000, help="Write rate limit of the bulk updater")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baselines")
+    parser.add_argument('--worker', nargs=2, metavar=('CASE', 'WORKDIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(*args.worker)
+        return 0
+
+    baselines = load_baselines(args.baseline)
+    failed = False
+    print(f"{'case':<8}{'resources':>10}{'seconds':>10}{'res/s':>10}{'calls':>8}{'rss MB':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for case in args.cases:
+        for size in args.sizes:
+            name = f"{case}:{size}"
+            result = run_case(case, size, args)
+            print(f"{case:<8}{size:>10}{result['seconds']:>10}{result['resources_per_second']:>10}{result['calls']:>8}"
+                  f"{result['peak_rss_mb']:>9}{str(result['p50_ms']):>9}{str(result['p99_ms']):>9}")
+            if args.update_baseline:
+                baselines[name] = result
+            elif name in baselines:
+                for regression in regressions(result, baselines[name], args.tolerance):
+                    print(f"  REGRESSION {name}: {regression}")
+                    failed = True
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"Baselines written to {args.baseline}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+# Defaults follow the ARM write token bucket per subscription (10 writes/s refill, burst of 200)
+TAG_WORKERS = int(os.environ.get('AZ_TAG_WORKERS', 8))
+TAG_WRITES_PER_SECOND = float(os.environ.get('AZ_TAG_WRITES_PER_SECOND', 10))
+TAG_WRITE_BURST = int(os.environ.get('AZ_TAG_WRITE_BURST', 200))
+TAG_MAX_RETRIES = int(os.environ.get('AZ_TAG_MAX_RETRIES', 5))
+MIN_WRITES_PER_SECOND = 0.5
+REMAINING_WRITES_HEADER = 'x-ms-ratelimit-remaining-subscription-writes'
+
+
+class TokenBucket:
+    # Rate adapts AIMD style: halved on throttling or when ARM reports few remaining writes, and grown back
+    # additively towards the configured rate while requests succeed
+    def __init__(self, rate, capacity):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0.0
+
+    def throttled(self, retry_after):
+        self.pause(retry_after)
+        with self.lock:
+            self.rate = max(MIN_WRITES_PER_SECOND, self.rate / 2)
+
+    def observe_remaining(self, remaining):
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining < self.capacity / 10:
+                self.rate = max(MIN_WRITES_PER_SECOND, self.rate / 2)
+            else:
+                self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+
+def response_headers(response):
+    http_response = getattr(response, 'http_response', response)
+    return getattr(http_response, 'headers', None) or {}
+
+
+def retry_after_seconds(headers):
+    for name in ('Retry-After', 'x-ms-retry-after-ms'):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) / (1000 if name.endswith('-ms') else 1)
+            except ValueError:
+                pass
+    return None
+
+
+class BulkTagExecutor:
+    def __init__(self, max_workers=TAG_WORKERS, writes_per_second=TAG_WRITES_PER_SECOND, burst=TAG_WRITE_BURST,
+                 max_retries=TAG_MAX_RETRIES, log=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.writes_per_second = writes_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.log = log or (lambda message: None)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, subscription_id):
+        with self.lock:
+            bucket = self.buckets.get(subscription_id.lower())
+            if bucket is None:
+                bucket = self.buckets[subscription_id.lower()] = TokenBucket(self.writes_per_second, self.burst)
+            return bucket
+
+    def observe(self, bucket, response):
+        # Called for every response; the only place the rate is lowered on a 429
+        headers = response_headers(response)
+        if getattr(getattr(response, 'http_response', response), 'status_code', None) == 429:
+            retry_after = retry_after_seconds(headers)
+            # Retry-After: 0 means no pause; only a missing header falls back to a second
+            bucket.throttled(1.0 if retry_after is None else retry_after)
+        remaining = headers.get(REMAINING_WRITES_HEADER)
+        if remaining is not None and remaining.isdigit():
+            bucket.observe_remaining(int(remaining))
+
+    def execute(self, subscription_id, operation, stats=None):
+        # operation(**kwargs) performs one write and must forward kwargs to the SDK call. The SDK retry policy is
+        # turned off for it, so every attempt goes through the bucket here. stats, when given, receives the last
+        # HTTP status and the number of retries, counted from the responses the hook sees.
+        bucket = self.bucket(subscription_id)
+        stats = stats if stats is not None else {}
+        stats['retries'] = 0
+        responses = [0]
+
+        def hook(response):
+            stats['status'] = getattr(getattr(response, 'http_response', response), 'status_code', None)
+            responses[0] += 1
+            stats['retries'] = responses[0] - 1
+            self.observe(bucket, response)
+
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                return operation(raw_response_hook=hook, retry_total=0)
+            except (HttpResponseError, ServiceRequestError, ServiceResponseError) as e:
+                # Connection errors, which the SDK retry policy used to cover, are retried like a 5xx
+                status = getattr(e, 'status_code', None) or 0
+                stats['status'] = status
+                transient = status == 429 or 500 <= status < 600 or not isinstance(e, HttpResponseError)
+                if attempt >= self.max_retries or not transient:
+                    raise
+                retry_after = retry_after_seconds(response_headers(e.response)) if getattr(e, 'response', None) is not None else None
+                delay = retry_after if retry_after is not None else min(60, 2 ** attempt)
+                delay *= random.uniform(1.0, 1.5)
+                self.log(f"Request throttled or failed with status {status} in subscription '{subscription_id}'. Retrying in {delay:.1f}s.")
+                if status == 429:
+                    # Pauses every writer of the subscription, the next acquire() waits it out. The hook has
+                    # already lowered the rate for this response.
+                    bucket.pause(delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
+                stats['retries'] = max(stats['retries'], attempt)
+
+    def submit(self, subscription_id, operation, stats=None):
+        # When the operation returns a Future (an LRO handed to the scheduler), the returned Future follows it
+        outcome = Future()
+
+        def forward(future):
+            if outcome.done():
+                # Cancelled by the caller
+                return
+            if future.exception() is not None:
+                outcome.set_exception(future.exception())
+            elif isinstance(future.result(), Future):
+                future.result().add_done_callback(forward)
+            else:
+                outcome.set_result(future.result())
+
+        self.executor.submit(self.execute, subscription_id, operation, stats).add_done_callback(forward)
+        return outcome
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
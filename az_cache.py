@@ -0,0 +1,9 @@
+import os
+
+# Caches shared by the tagging scripts live next to the ResourceTagLogs folder unless AZ_TAG_CACHE_DIR is set
+CACHE_DIRECTORY = os.environ.get('AZ_TAG_CACHE_DIR', os.path.join(os.path.expanduser("~"), "ResourceTagCache"))
+
+
+def cache_path(name):
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    return os.path.join(CACHE_DIRECTORY, name)
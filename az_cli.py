@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import argparse
+from az_metrics import metrics
+from az_daemon_client import forward
+
+# Headless entry points: python az_cli.py export | pull | update | bulk-update | rollback | daemon.
+# Each command first offers its job to a running az_daemon.py; the Azure SDK, pandas and openpyxl are only
+# imported inside the command that runs in this process. --metrics prints the phase timings at the end,
+# including start_to_first_response, the cold start up to the first API response.
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def job_exit_code(job):
+    return 0 if job['status'] == 'succeeded' else 1
+
+
+def print_json(value):
+    print(json.dumps(value, indent=2))
+
+
+def tag_pair(value):
+    key, separator, tag_value = value.partition('=')
+    if not separator or not key:
+        raise argparse.ArgumentTypeError(f"tags are given as KEY=VALUE, got '{value}'")
+    return key, tag_value
+
+
+def run_export(args):
+    options = {'backend': args.backend, 'formats': args.formats.split(',') if args.formats else None,
+               'export_mode': args.mode, 'all_tags': True if args.all_tags else None}
+    # InventoryExport.run forwards to the daemon itself, with the AZ_EXPORT_* settings of this process
+    from az_export import InventoryExport
+    export = InventoryExport()
+    export.configure(**options)
+    return 0 if export.run() else 1
+
+
+def run_pull(args):
+    job = forward('pull', log=lambda message: print(message, file=sys.stderr), subscription_id=args.subscription,
+                  resource_group=args.resource_group, resource_name=args.name)
+    if job:
+        if job['result']:
+            print_json(job['result'])
+        return job_exit_code(job)
+    from az_session import azure_session
+    from az_resource_lookup import ResourceLookup
+    azure_session.authenticate(log=lambda message: print(message, file=sys.stderr))
+    try:
+        print_json(ResourceLookup().pull(args.subscription, args.resource_group, args.name))
+    except LookupError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_update(args):
+    tags = dict(args.tag)
+    job = forward('update', subscription_id=args.subscription, resource_group=args.resource_group, resource_name=args.name, tags=tags)
+    if job:
+        return job_exit_code(job)
+    from az_session import azure_session
+    from az_resource_lookup import ResourceLookup
+    from az_tag_writer import update_resource_tags
+    from az_tag_journal import TagJournal, journal_path
+    azure_session.authenticate()
+    # Journaled with the updates of Update_AZ_Resource_Tag.py, so az_tag_rollback.py can undo it
+    journal = TagJournal(journal_path('single_updates'))
+    journal.start()
+    try:
+        update_resource_tags(ResourceLookup(), args.subscription, args.resource_group, args.name, tags, journal)
+    except LookupError as e:
+        print(e)
+        return 1
+    finally:
+        journal.close()
+    return 0
+
+
+def run_bulk_update(args):
+    # The script forwards to the daemon itself
+    import runpy
+    sys.argv = ['Update_AZ_Multiple_Resource_Tag.py'] + args.arguments
+    runpy.run_path(os.path.join(SCRIPT_DIRECTORY, 'Update_AZ_Multiple_Resource_Tag.py'), run_name='__main__')
+    return 0
+
+
+def run_rollback(args):
+    from az_tag_rollback import main
+    return main(args.arguments)
+
+
+def run_daemon(args):
+    from az_daemon import main
+    return main(args.arguments)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, read and update Azure resource tags without a UI.")
+    parser.add_argument('--metrics', action='store_true', help="Print phase timings and API calls at the end")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="Export the resource inventory")
+    export_parser.add_argument('--backend', choices=['arm', 'graph'])
+    export_parser.add_argument('--formats', help="Comma separated: xlsx, csv, jsonl, parquet")
+    export_parser.add_argument('--mode', choices=['full', 'delta', 'both'])
+    export_parser.add_argument('--all-tags', action='store_true', help="One column per distinct tag key")
+    export_parser.set_defaults(handler=run_export)
+
+    for name, handler, help_text in [('pull', run_pull, "Print the tags of a resource as JSON"),
+                                     ('update', run_update, "Update the tags of a resource")]:
+        command_parser = commands.add_parser(name, help=help_text)
+        command_parser.add_argument('--subscription', required=True, help="Subscription ID")
+        command_parser.add_argument('--resource-group', required=True, help="Resource group name")
+        command_parser.add_argument('--name', required=True, help="Resource name or resource ID")
+        if name == 'update':
+            command_parser.add_argument('--tag', action='append', required=True, type=tag_pair, metavar='KEY=VALUE', help="Tag to set, repeatable")
+        command_parser.set_defaults(handler=handler)
+
+    for name, handler, help_text in [('bulk-update', run_bulk_update, "Run Update_AZ_Multiple_Resource_Tag.py with the given arguments"),
+                                     ('rollback', run_rollback, "Run az_tag_rollback.py with the given arguments"),
+                                     ('daemon', run_daemon, "Run the tagging daemon")]:
+        command_parser = commands.add_parser(name, help=help_text, add_help=False)
+        command_parser.add_argument('arguments', nargs=argparse.REMAINDER)
+        command_parser.set_defaults(handler=handler)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(args) or 0
+    finally:
+        if args.metrics:
+            for line in metrics.summary():
+                print(line, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
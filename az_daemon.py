@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import hmac
+import uuid
+import time
+import queue
+import runpy
+import logging
+import secrets
+import argparse
+import threading
+import collections
+from contextlib import redirect_stdout
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import az_daemon_client
+from az_cache import cache_path
+from az_session import azure_session
+from az_api_versions import api_versions
+from az_resource_index import ResourceIndex, latest_inventory, FULL_EXPORT_HINT
+from az_resource_lookup import ResourceLookup
+from az_tag_writer import TagWriter, update_resource_tags
+from az_tag_journal import TagJournal, journal_path
+from az_metrics import metrics
+
+# Headless daemon for automation that runs many small tag jobs. Credentials, the pooled clients, provider
+# API versions, resource group listings and the inventory index stay warm between jobs. Jobs are accepted
+# over HTTP on 127.0.0.1 and run one at a time in submission order; the port and a random access token are
+# published in daemon.json in AZ_TAG_CACHE_DIR, which the scripts read through az_daemon_client.
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = int(os.environ.get('AZ_DAEMON_PORT', 0))
+JOB_KINDS = ['export', 'pull', 'update', 'bulk_update', 'rollback']
+JOB_HISTORY = 200
+JOB_LOG_LINES = 10000
+# Longest a GET /jobs/<id>?wait=<seconds> blocks until the job writes output or finishes
+JOB_MAX_WAIT = 30
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+class Job:
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        # Only the last JOB_LOG_LINES lines are kept; log_end counts every line written
+        self.log = collections.deque(maxlen=JOB_LOG_LINES)
+        self.log_end = 0
+        self.partial = ''
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def write(self, text):
+        # stdout of the job's scripts (and their worker threads) is redirected here
+        with self.lock:
+            lines = (self.partial + text).split('\n')
+            self.partial = lines.pop()
+            self.log.extend(lines)
+            self.log_end += len(lines)
+            if lines:
+                self.changed.notify_all()
+        return len(text)
+
+    def notify(self):
+        with self.lock:
+            self.changed.notify_all()
+
+    def set_progress(self, value, total):
+        with self.lock:
+            self.progress = [value, total]
+            self.changed.notify_all()
+
+    def wait(self, since, timeout):
+        # Until the job writes output past line since, reports progress or finishes
+        with self.lock:
+            progress = self.progress
+            self.changed.wait_for(lambda: self.log_end > since or self.progress != progress or self.status in az_daemon_client.FINISHED_STATUSES, timeout)
+
+    def flush(self):
+        pass
+
+    def as_dict(self, since=None):
+        with self.lock:
+            job = {
+                'id': self.id, 'kind': self.kind, 'status': self.status, 'result': self.result, 'error': self.error,
+                'progress': self.progress, 'submitted': self.submitted, 'started': self.started, 'finished': self.finished,
+                'log_end': self.log_end
+            }
+            if since is not None:
+                first = self.log_end - len(self.log)
+                job['log'] = list(self.log)[max(0, since - first):]
+        return job
+
+
+class TagDaemon:
+    def __init__(self):
+        self.jobs = collections.OrderedDict()
+        self.pending = queue.Queue()
+        self.lookup = ResourceLookup()
+        self.index = ResourceIndex()
+        self.tag_writer = TagWriter()
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def warm(self, log=logging.info):
+        azure_session.authenticate(log=log)
+        if latest_inventory() is None:
+            log(FULL_EXPORT_HINT)
+        self.index = ResourceIndex.from_inventory()
+        log(f"Loaded {len(self.index.ids)} resources from the latest inventory.")
+
+    def submit(self, kind, params):
+        job = Job(kind, params)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > JOB_HISTORY:
+                oldest = next(iter(self.jobs.values()))
+                if oldest.status not in az_daemon_client.FINISHED_STATUSES:
+                    break
+                self.jobs.popitem(last=False)
+        self.pending.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def status(self):
+        with self.lock:
+            counts = collections.Counter(job.status for job in self.jobs.values())
+        return {
+            'pid': os.getpid(), 'started': self.started, 'jobs': dict(counts), 'queued': self.pending.qsize(),
+            'clients': len(azure_session.clients), 'api_versions': len(api_versions.entries),
+            'resource_groups': len(self.lookup.indexes), 'indexed_resources': len(self.index.ids)
+        }
+
+    def work(self):
+        while True:
+            job = self.pending.get()
+            if job is None:
+                return
+            self.run_job(job)
+
+    def run_job(self, job):
+        # Jobs run one at a time, so the working directory and stdout can be switched for each
+        cwd = os.getcwd()
+        params = {key: value for key, value in job.params.items() if key != 'cwd'}
+        job.status, job.started = 'running', time.time()
+        logging.info(f"Job {job.id} ({job.kind}) started.")
+        metrics.reset()
+        try:
+            os.chdir(job.params.get('cwd') or cwd)
+            with redirect_stdout(job):
+                job.result = getattr(self, f"run_{job.kind}")(job, **params)
+            job.status = 'succeeded'
+        except SystemExit as e:
+            # Scripts and argparse exit with a status
+            job.status = 'succeeded' if not e.code else 'failed'
+            job.error = None if not e.code else f"Exited with {e.code}"
+        except Exception as e:
+            logging.exception(f"Job {job.id} ({job.kind}) failed.")
+            job.status, job.error = 'failed', str(e)
+        finally:
+            os.chdir(cwd)
+            if job.partial:
+                job.write('\n')
+            job.finished = time.time()
+            job.notify()
+        logging.info(f"Job {job.id} ({job.kind}) {job.status} in {job.finished - job.started:.1f}s.")
+
+    def run_script(self, name, argv):
+        saved_argv = sys.argv
+        sys.argv = [name] + list(argv)
+        try:
+            runpy.run_path(os.path.join(SCRIPT_DIRECTORY, name), run_name='__main__')
+        finally:
+            sys.argv = saved_argv
+
+    def run_export(self, job, **options):
+        from az_export import InventoryExport
+        total = [0]
+        export = InventoryExport(on_total=lambda value: total.__setitem__(0, value),
+                                 on_progress=lambda value: job.set_progress(value, total[0]))
+        export.configure(**options)
+        export.run()
+        # Later lookups see the resources of the new inventory
+        self.index = ResourceIndex.from_inventory()
+
+    def run_pull(self, job, subscription_id, resource_group, resource_name):
+        return self.lookup.pull(subscription_id, resource_group, resource_name, self.index)
+
+    def run_update(self, job, subscription_id, resource_group, resource_name, tags):
+        journal = TagJournal(journal_path('single_updates'))
+        journal.start()
+        try:
+            return update_resource_tags(self.lookup, subscription_id, resource_group, resource_name, tags, journal, self.tag_writer, self.index)
+        finally:
+            journal.close()
+
+    def run_bulk_update(self, job, argv):
+        self.run_script('Update_AZ_Multiple_Resource_Tag.py', argv)
+
+    def run_rollback(self, job, argv):
+        from az_tag_rollback import main
+        main(argv)
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        if hmac.compare_digest(self.headers.get('Authorization', ''), f"Bearer {self.server.token}"):
+            return True
+        self.send_json(401, {'error': 'Missing or wrong daemon token'})
+        return False
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        daemon = self.server.tag_daemon
+        if parts == ['status']:
+            self.send_json(200, daemon.status())
+        elif parts == ['jobs']:
+            with daemon.lock:
+                jobs = list(daemon.jobs.values())
+            self.send_json(200, {'jobs': [job.as_dict() for job in jobs]})
+        elif len(parts) == 2 and parts[0] == 'jobs' and daemon.get(parts[1]):
+            query = parse_qs(url.query)
+            job, since = daemon.get(parts[1]), int(query.get('since', [0])[0])
+            if 'wait' in query:
+                job.wait(since, min(float(query['wait'][0]), JOB_MAX_WAIT))
+            self.send_json(200, job.as_dict(since))
+        else:
+            self.send_json(404, {'error': f"Unknown path '{url.path}'"})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        path = urlsplit(self.path).path.strip('/')
+        if path == 'jobs':
+            params = self.read_json()
+            kind = params.pop('kind', None)
+            if kind not in JOB_KINDS:
+                self.send_json(400, {'error': f"Unknown job kind '{kind}', expected one of {', '.join(JOB_KINDS)}"})
+                return
+            self.send_json(202, {'id': self.server.tag_daemon.submit(kind, params).id})
+        elif path == 'shutdown':
+            self.send_json(200, {'status': 'stopping'})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            self.send_json(404, {'error': f"Unknown path '{path}'"})
+
+
+def publish(server):
+    # Readable by the current user only, since the token grants access to the daemon
+    path = cache_path(az_daemon_client.DAEMON_FILE)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump({'port': server.server_address[1], 'token': server.token, 'pid': os.getpid()}, file)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the tagging daemon that keeps credentials and caches warm between jobs.")
+    parser.add_argument('--port', type=int, default=DAEMON_PORT, help="Port on 127.0.0.1 (default: a free port)")
+    args = parser.parse_args(argv)
+
+    log_directory = os.path.join(os.path.expanduser("~"), "ResourceTagLogs")
+    os.makedirs(log_directory, exist_ok=True)
+    logging.basicConfig(filename=os.path.join(log_directory, f"TagDaemon_{datetime.now().strftime('%Y%m%d')}.log"),
+                        level=logging.INFO, format='%(asctime)s - %(message)s')
+
+    def log_and_print(message):
+        print(message)
+        logging.info(message)
+
+    az_daemon_client.in_daemon = True
+    daemon = TagDaemon()
+    daemon.warm(log=log_and_print)
+    server = ThreadingHTTPServer((DAEMON_HOST, args.port), DaemonHandler)
+    server.daemon_threads = True
+    server.tag_daemon = daemon
+    server.token = secrets.token_urlsafe(32)
+    path = publish(server)
+    worker = threading.Thread(target=daemon.work, name="TagDaemonWorker", daemon=True)
+    worker.start()
+    log_and_print(f"Tagging daemon listening on http://{DAEMON_HOST}:{server.server_address[1]} (address in {path})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.pending.put(None)
+        if az_daemon_client.daemon_address() == {'port': server.server_address[1], 'token': server.token, 'pid': os.getpid()}:
+            os.remove(path)
+        log_and_print("Tagging daemon stopped.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import os
+import json
+import urllib.request
+from az_cache import cache_path
+
+# The scripts hand their work to a running az_daemon.py, which keeps credentials, clients and caches warm,
+# and only fall back to running in-process when no daemon answers. AZ_DAEMON=0 always runs in-process.
+# Only the standard library is imported here, so forwarding a job never loads pandas or the Azure SDK.
+DAEMON_FILE = 'daemon.json'
+DAEMON_ENABLED = os.environ.get('AZ_DAEMON', '1') != '0'
+# Each poll waits up to this long on the daemon for new output
+JOB_WAIT = 5
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+# Set by the daemon itself so the scripts it runs never forward back to it
+in_daemon = False
+
+
+def daemon_address():
+    try:
+        with open(cache_path(DAEMON_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+class DaemonClient:
+    def __init__(self, address):
+        self.url = f"http://127.0.0.1:{address['port']}"
+        self.token = address['token']
+
+    def request(self, method, path, body=None, timeout=10):
+        request = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(body).encode('utf-8') if body is not None else None,
+            headers={'Authorization': f"Bearer {self.token}", 'Content-Type': 'application/json'},
+            method=method
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.load(response)
+
+    def status(self, timeout=10):
+        return self.request('GET', '/status', timeout=timeout)
+
+    def submit(self, kind, **params):
+        return self.request('POST', '/jobs', {'kind': kind, 'cwd': os.getcwd(), **params})['id']
+
+    def job(self, job_id, since=0, wait=None):
+        return self.request('GET', f"/jobs/{job_id}?since={since}" + (f"&wait={wait}" if wait else ''), timeout=(wait or 0) + 10)
+
+    def follow(self, job_id, log=print, progress=None):
+        # Streams the job's output until it finishes
+        since = 0
+        while True:
+            job = self.job(job_id, since, wait=JOB_WAIT)
+            for line in job['log']:
+                log(line)
+            since = job['log_end']
+            if progress and job.get('progress'):
+                progress(*job['progress'])
+            if job['status'] in FINISHED_STATUSES:
+                return job
+
+
+def connect():
+    # Client of the running daemon, or None
+    if in_daemon or not DAEMON_ENABLED:
+        return None
+    address = daemon_address()
+    if not address:
+        return None
+    client = DaemonClient(address)
+    try:
+        client.status(timeout=1)
+    except (OSError, ValueError):
+        return None
+    return client
+
+
+def forward(kind, log=print, progress=None, **params):
+    # Runs the job in the daemon and returns it once finished, or None when no daemon is running
+    client = connect()
+    if client is None:
+        return None
+    log(f"Running {kind} in the tagging daemon...")
+    job = client.follow(client.submit(kind, **params), log=log, progress=progress)
+    if job['status'] == 'failed':
+        log(f"Job failed: {job['error']}")
+    return job
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+# One JSON line per operation (resource ID, action, old/new tags, latency, HTTP status, retries, outcome),
+# shared by every script. Records are handed to a background QueueListener, buffered and flushed in batches
+# to a file that all processes append to; it is rotated once it would grow past AZ_TAG_EVENT_LOG_MAX_BYTES.
+# Request payloads are only logged when AZ_TAG_VERBOSE=1.
+EVENT_LOG_FILE = os.environ.get('AZ_TAG_EVENT_LOG', os.path.join(os.path.expanduser("~"), "ResourceTagLogs", "operations.jsonl"))
+EVENT_LOG_MAX_BYTES = int(os.environ.get('AZ_TAG_EVENT_LOG_MAX_BYTES', 50 * 1024 * 1024))
+EVENT_LOG_BACKUPS = int(os.environ.get('AZ_TAG_EVENT_LOG_BACKUPS', 5))
+EVENT_LOG_BUFFER = 500
+EVENT_LOG_FLUSH_INTERVAL = 1.0
+VERBOSE = os.environ.get('AZ_TAG_VERBOSE', '0') == '1'
+
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        event = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'script': os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+            'action': record.getMessage(),
+            **getattr(record, 'event', {})
+        }
+        return json.dumps(event, default=str)
+
+
+@contextmanager
+def file_lock(path):
+    # Exclusive lock between processes, held on a separate lock file so the log itself can be renamed
+    with open(path, 'a+b') as lock_file:
+        if os.name == 'nt':
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds
+                    pass
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SharedRotatingHandler(logging.handlers.BufferingHandler):
+    # Buffers records and writes each batch under the lock file: the size check, the rotation and the append
+    # happen while no other process has the log open, so renaming it is safe on Windows as well and no line
+    # is lost or split. Flushes when the buffer is full or on an error record.
+    def __init__(self, path, capacity, max_bytes, backups, flush_level=logging.ERROR):
+        super().__init__(capacity)
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_level = flush_level
+
+    def shouldFlush(self, record):
+        return len(self.buffer) >= self.capacity or record.levelno >= self.flush_level
+
+    def flush(self):
+        with self.lock:
+            if not self.buffer:
+                return
+            records, self.buffer = self.buffer, []
+            try:
+                data = ''.join(self.format(record) + '\n' for record in records).encode('utf-8')
+                with file_lock(self.lock_path):
+                    size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                    if self.max_bytes > 0 and self.backups > 0 and size and size + len(data) > self.max_bytes:
+                        self.rotate()
+                    with open(self.path, 'ab') as log_file:
+                        log_file.write(data)
+            except Exception:
+                self.handleError(records[-1])
+
+    def rotate(self):
+        # Same names as RotatingFileHandler: operations.jsonl.1 is the newest backup
+        try:
+            for index in range(self.backups - 1, 0, -1):
+                source = '%s.%d' % (self.path, index)
+                if os.path.exists(source):
+                    os.replace(source, '%s.%d' % (self.path, index + 1))
+            os.replace(self.path, self.path + '.1')
+        except OSError:
+            # Another program (an editor, a tail) holds the file open on Windows; rotate on a later batch
+            pass
+
+
+class EventLog:
+    def __init__(self, path=EVENT_LOG_FILE, verbose=VERBOSE):
+        self.path = path
+        self.verbose = verbose
+        self.logger = logging.getLogger('az_events')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.listener = None
+        self.handler = None
+        self.buffer = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.listener:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.buffer = SharedRotatingHandler(self.path, EVENT_LOG_BUFFER, EVENT_LOG_MAX_BYTES, EVENT_LOG_BACKUPS)
+            self.buffer.setFormatter(JsonFormatter())
+            events = queue.Queue()
+            self.handler = logging.handlers.QueueHandler(events)
+            self.logger.addHandler(self.handler)
+            self.listener = logging.handlers.QueueListener(events, self.buffer)
+            self.listener.start()
+            # A fresh event per start, so a log restarted after stop() gets its flush thread back
+            self.stopped = threading.Event()
+            threading.Thread(target=self.flush_periodically, args=(self.stopped, self.buffer), name="EventLogFlush", daemon=True).start()
+            atexit.register(self.stop)
+
+    def flush_periodically(self, stopped, buffer):
+        while not stopped.wait(EVENT_LOG_FLUSH_INTERVAL):
+            buffer.flush()
+
+    def record(self, action, level=logging.INFO, **fields):
+        if not self.listener:
+            self.start()
+        self.logger.log(level, action, extra={'event': fields})
+
+    def payload(self, action, **fields):
+        # Full request bodies, only written in verbose mode
+        if self.verbose:
+            self.record(action, **fields)
+
+    @contextmanager
+    def operation(self, action, **fields):
+        # Records latency and outcome; the block can add fields such as status or retries to the yielded dict
+        started = time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields.setdefault('status', getattr(e, 'status_code', None))
+            self.record(action, level=logging.ERROR, **{**fields, 'outcome': 'failed', 'error': str(e), 'latency_ms': elapsed_ms(started)})
+            raise
+        self.record(action, **{'outcome': 'succeeded', **fields, 'latency_ms': elapsed_ms(started)})
+
+    def stop(self):
+        with self.lock:
+            if self.listener:
+                self.logger.removeHandler(self.handler)
+                self.listener.stop()
+                self.stopped.set()
+                self.buffer.close()
+                self.listener = None
+                atexit.unregister(self.stop)
+
+
+event_log = EventLog()
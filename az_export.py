@@ -0,0 +1,253 @@
+import os
+import json
+import queue
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from az_resource_graph import ResourceGraphBackend, TAG_KEYS
+from az_cache import cache_path
+from az_event_log import event_log
+from az_metrics import metrics
+from az_daemon_client import forward
+from az_resource_filter import ResourceTypeFilter
+from az_export_sinks import ExcelSink, ExportPipeline, SINKS, tag_column
+from az_snapshot import SnapshotStore, DeltaSink
+
+# The inventory export without any UI: Get_AZ_Resources.py runs it in a QThread, az_cli.py and the daemon
+# call it directly. Progress and log lines are reported through the callbacks. The Azure SDK, pandas and
+# openpyxl are only imported once an export actually runs.
+
+
+class InventoryExport:
+    def __init__(self, log=print, on_total=None, on_progress=None):
+        self.log = log
+        self.on_total = on_total or (lambda total: None)
+        self.on_progress = on_progress or (lambda value: None)
+        self.subscription_ids = [
+            '7f9b36c9-5325-495c-aa2a-7c7350f302a0', 'f141e7fc-929b-4ae9-a968-94222e866042',
+            'ee1c5b76-97f0-46ef-bbb0-62e6f080456b', '692efea0-2038-48e2-bf74-a333fef44d58',
+            '7bd7cad1-cba0-45dd-8962-6efa16660e26', 'f18b2c7d-1eb0-46d3-9ebf-1d5073e05239'
+        ]
+        self.subscription_map = {
+            '7f9b36c9-5325-495c-aa2a-7c7350f302a0': 'bmgf-eds-nonprod-00',
+            'f141e7fc-929b-4ae9-a968-94222e866042': 'bmgf-eds-nonprod-traditional-00',
+            'ee1c5b76-97f0-46ef-bbb0-62e6f080456b': 'bmgf-eds-prod-00',
+            '692efea0-2038-48e2-bf74-a333fef44d58': 'Global Data & Analytics - NonProd',
+            '7bd7cad1-cba0-45dd-8962-6efa16660e26': 'Global Data & Analytics - Prod',
+            'f18b2c7d-1eb0-46d3-9ebf-1d5073e05239': 'ISS Azure PROD'
+        }
+        self.location_map = {
+            'eastus': 'East US', 'westus': 'West US', 'northeurope': 'North Europe', 'australiaeast': 'Australia East'
+        }
+        self.type_map = {
+            'microsoft.insights/components': 'Application Insights',
+            'microsoft.cache/redis': 'Azure Cache for Redis',
+            'microsoft.containerregistry/registries': 'Container registry'
+        }
+        self.type_filter = ResourceTypeFilter.from_file()
+        self.columns = [
+            "SUBSCRIPTION_NAME", "SUBSCRIPTION_ID", "RESOURCE_GROUP", "RESOURCE_NAME", "LOCATION", "TYPE", "KIND",
+            "TAG_APPLICATION", "TAG_OWNER", "TAG_COST_CENTER", "TAG_ENVIRONMENT", "ID"
+        ]
+        self.count_cache_file = cache_path('resource_counts.json')
+        self.max_workers = int(os.environ.get('AZ_EXPORT_WORKERS', len(self.subscription_ids)))
+        # 'arm' lists full resources through ResourceManagementClient, 'graph' queries Azure Resource Graph
+        self.backend = os.environ.get('AZ_EXPORT_BACKEND', 'arm')
+        # Output formats out of xlsx, csv, jsonl and parquet; all-tags mode adds a column per distinct tag key
+        self.formats = [f.strip() for f in os.environ.get('AZ_EXPORT_FORMATS', 'xlsx').split(',') if f.strip()]
+        self.all_tags = os.environ.get('AZ_EXPORT_ALL_TAGS', '0') == '1'
+        # 'delta' (default) writes only the changes since the last snapshot (plus the full inventory on the first
+        # run), 'both' the complete inventory and the changes and 'full' the inventory without a snapshot. The GUI
+        # resource index and az_tag_plan.py read the newest full inventory, which 'full' or 'both' refresh.
+        self.export_mode = os.environ.get('AZ_EXPORT_MODE', 'delta')
+        self.snapshot_file = cache_path('inventory_snapshot.sqlite')
+        # Progress signals are coalesced to at most AZ_EXPORT_UI_RATE updates per second
+        self.progress_interval = 1 / float(os.environ.get('AZ_EXPORT_UI_RATE', 20))
+        self.last_progress_time = 0
+        self.last_progress = (None, None)
+        self.progress_signals = 0
+
+    def configure(self, backend=None, formats=None, export_mode=None, all_tags=None):
+        # Command line options of az_cli.py export, overriding the AZ_EXPORT_* settings
+        self.backend = backend or self.backend
+        self.formats = formats or self.formats
+        self.export_mode = export_mode or self.export_mode
+        self.all_tags = self.all_tags if all_tags is None else all_tags
+
+    def authenticate(self):
+        from az_session import azure_session
+        return azure_session.authenticate(log=self.log)
+
+    def get_resource_group_from_id(self, resource_id):
+        parts = resource_id.split('/')
+        try:
+            return parts[parts.index('resourceGroups') + 1]
+        except ValueError:
+            return None
+
+    def load_resource_counts(self):
+        try:
+            with open(self.count_cache_file) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_resource_counts(self, counts):
+        with open(self.count_cache_file, 'w') as cache_file:
+            json.dump(counts, cache_file)
+
+    def build_row(self, subscription_id, item):
+        # Resource Graph returns types lower-cased, ARM as registered; both backends write the lower-cased type
+        resource_type = item.type.lower() if item.type else item.type
+        row = {
+            "SUBSCRIPTION_NAME": self.subscription_map.get(subscription_id, subscription_id),
+            "SUBSCRIPTION_ID": subscription_id,
+            "RESOURCE_GROUP": self.get_resource_group_from_id(item.id),
+            "RESOURCE_NAME": item.name,
+            "LOCATION": self.location_map.get(item.location, item.location),
+            "TYPE": self.type_map.get(resource_type, resource_type),
+            "KIND": item.kind,
+            "TAG_APPLICATION": item.tags.get("application") if item.tags else None,
+            "TAG_OWNER": item.tags.get("owner") if item.tags else None,
+            "TAG_COST_CENTER": item.tags.get("cost-center") if item.tags else None,
+            "TAG_ENVIRONMENT": item.tags.get("environment") if item.tags else None,
+            "ID": item.id
+        }
+        if self.all_tags and item.tags:
+            for key, value in item.tags.items():
+                if row.get(tag_column(key)) is None:
+                    row[tag_column(key)] = value
+        return row
+
+    def list_pages(self, credential, subscription_id):
+        if self.backend == 'graph':
+            # Type exclusion and column projection happen server side
+            yield from ResourceGraphBackend(credential, tag_keys=None if self.all_tags else TAG_KEYS).list_pages([subscription_id], self.type_filter)
+        else:
+            from az_session import azure_session
+            resource_client = azure_session.get_client(subscription_id)
+            for page in resource_client.resources.list(filter=self.type_filter.to_arm_filter()).by_page():
+                yield [item for item in page if self.type_filter.allows(item.type)]
+
+    def count_resources(self, credential):
+        if self.backend == 'graph':
+            try:
+                return ResourceGraphBackend(credential).count_by_subscription(self.subscription_ids, self.type_filter)
+            except Exception as e:
+                self.log(f"Failed to count resources with Resource Graph. Error: {e}")
+        return self.load_resource_counts()
+
+    def collect_subscription(self, credential, subscription_id, pages):
+        try:
+            with event_log.operation('list_resources', subscription_id=subscription_id, backend=self.backend) as event:
+                event['resources'] = 0
+                for page in metrics.timed('list_page', self.list_pages(credential, subscription_id)):
+                    event['resources'] += len(page)
+                    with metrics.span('build_rows'):
+                        rows = [self.build_row(subscription_id, item) for item in page]
+                    pages.put((subscription_id, rows, None))
+        except Exception as e:
+            pages.put((subscription_id, None, e))
+            return
+        pages.put((subscription_id, None, None))
+
+    def stream_pages(self, credential):
+        # Subscriptions are listed concurrently and their pages merged into one stream, so only
+        # this thread emits Qt signals. A (subscription_id, None, error) item marks the end of a subscription.
+        pages = queue.Queue()
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            for subscription_id in self.subscription_ids:
+                executor.submit(self.collect_subscription, credential, subscription_id, pages)
+            remaining = len(self.subscription_ids)
+            while remaining:
+                item = pages.get()
+                if item[1] is None:
+                    remaining -= 1
+                yield item
+
+    def report_progress(self, value, total, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_progress_time < self.progress_interval:
+            return
+        self.last_progress_time = now
+        if total != self.last_progress[1]:
+            self.on_total(total)
+            self.progress_signals += 1
+        if value != self.last_progress[0]:
+            self.on_progress(value)
+            self.progress_signals += 1
+        self.last_progress = (value, total)
+
+    def run(self):
+        # A running az_daemon.py does the export with its credential and clients already warm, using the
+        # settings resolved here rather than its own environment
+        job = forward('export', log=self.log, progress=lambda value, total: self.report_progress(value, total, force=True),
+                      backend=self.backend, formats=self.formats, export_mode=self.export_mode, all_tags=self.all_tags)
+        if job:
+            return job['status'] == 'succeeded'
+        metrics.start_profile()
+        self.log("Initializing credentials and clients...")
+        with metrics.span('authenticate'):
+            credential = self.authenticate()
+
+        export_folder = 'exports'
+        if not os.path.exists(export_folder):
+            os.makedirs(export_folder)
+        output_base = os.path.join(export_folder, f"{datetime.now().strftime('%B_%d_%Y')}_EDS_DIO_AZ_Resources_Inventory")
+        sinks = []
+        store = SnapshotStore(self.snapshot_file, self.columns, self.all_tags) if self.export_mode != 'full' else None
+        full_export = self.export_mode != 'delta' or not store.has_snapshot()
+        for export_format in self.formats if full_export else []:
+            if export_format == 'xlsx':
+                sinks.append(ExcelSink(output_base + ExcelSink.extension, sort_by=['TAG_APPLICATION', 'SUBSCRIPTION_NAME']))
+            else:
+                sinks.append(SINKS[export_format](output_base + SINKS[export_format].extension))
+        if store:
+            sinks.append(DeltaSink(store, output_base + DeltaSink.extension))
+        pipeline = ExportPipeline(sinks, self.columns)
+
+        # Progress total comes from a Resource Graph count or the counts of the previous run,
+        # and is refined as pages arrive
+        with metrics.span('count_resources'):
+            cached_counts = self.count_resources(credential)
+        estimates = {subscription_id: cached_counts.get(subscription_id, 0) for subscription_id in self.subscription_ids}
+        self.report_progress(0, sum(estimates.values()), force=True)
+        self.log("In progress...")
+
+        current_resource = 0
+        counts = {}
+        for subscription_id, rows, error in self.stream_pages(credential):
+            if rows is None:
+                if error is not None:
+                    self.log(f"Failed to list resources for subscription '{self.subscription_map.get(subscription_id, subscription_id)}'. Error: {error}")
+                    counts.pop(subscription_id, None)
+                    if store:
+                        store.keep_subscription(subscription_id)
+                    continue
+                counts.setdefault(subscription_id, 0)
+                estimates[subscription_id] = counts[subscription_id]
+            else:
+                with metrics.span('write_rows'):
+                    pipeline.write_rows(rows)
+                current_resource += len(rows)
+                counts[subscription_id] = counts.get(subscription_id, 0) + len(rows)
+                estimates[subscription_id] = max(estimates[subscription_id], counts[subscription_id])
+            self.report_progress(current_resource, max(current_resource, sum(estimates.values())))
+
+        self.report_progress(current_resource, max(current_resource, sum(estimates.values())), force=True)
+        self.log(f"Listed {current_resource} resources with {self.progress_signals} progress updates.")
+        self.save_resource_counts({**cached_counts, **counts})
+
+        self.log("Processing data...")
+        with metrics.span('finalize'):
+            pipeline.close()
+
+        for sink in sinks:
+            self.log(f"Data has been successfully exported to {output_base + sink.extension}")
+            if isinstance(sink, DeltaSink):
+                self.log(f"Changes since the last snapshot: {sink.counts['added']} added, {sink.counts['removed']} removed, {sink.counts['changed']} changed")
+        event_log.record('export', resources=current_resource, subscriptions=len(counts), mode=self.export_mode,
+                         files=[output_base + sink.extension for sink in sinks])
+        metrics.finish('Get_AZ_Resources', log=self.log)
+        self.log("Export complete!")
+        return True
@@ -0,0 +1,228 @@
+import os
+import csv
+import gzip
+import json
+import heapq
+import pickle
+import shutil
+import tempfile
+import warnings
+import itertools
+from az_metrics import metrics
+
+# Every sink receives the same stream of row dicts from ExportPipeline, together with the columns
+# discovered so far. Columns only ever grow and new ones are appended at the end. pandas, openpyxl and
+# pyarrow are only imported by the sinks that use them.
+# The Excel sink keeps at most SPILL_ROWS rows in memory and spills the rest to temporary files
+SPILL_ROWS = int(os.environ.get('AZ_EXPORT_SPILL_ROWS', 50000))
+SPILL_CHUNK_ROWS = 1000
+
+
+def tag_column(tag_key):
+    return "TAG_" + tag_key.upper().replace("-", "_").replace(" ", "_")
+
+
+class ExcelSink:
+    extension = ".xlsx"
+
+    # Writes through a write-only workbook so no cell objects are kept in memory. openpyxl emits the column
+    # widths and the header before the first row, and both are only final once every batch has arrived, so rows
+    # are collected as plain tuples while widths are tracked per batch. Every SPILL_ROWS rows the collected
+    # rows are sorted (when sort_by is given) and spilled to a temporary file; close() merges the sorted runs
+    # with heapq.merge, or chains them in arrival order, straight into the sheet.
+    def __init__(self, path, sheet_name="Pulled_Azure_Resources", table_name="Table1", sort_by=None):
+        self.path = path
+        self.sheet_name = sheet_name
+        self.table_name = table_name
+        self.sort_by = sort_by or []
+        self.positions = None
+        self.rows = []
+        self.runs = []
+        self.row_count = 0
+        import pandas
+        self.pd = pandas
+        self.widths = pandas.Series(dtype="int64")
+
+    def write_rows(self, rows, columns):
+        with metrics.span('column_widths'):
+            batch = self.pd.DataFrame.from_records(rows, columns=columns)
+            lengths = batch.fillna('').astype(str).apply(lambda column: column.str.len().max())
+            self.widths = self.widths.combine(lengths, max, fill_value=0)
+        if self.positions is None:
+            self.positions = [columns.index(column) for column in self.sort_by]
+        self.rows.extend(tuple(row.get(column) for column in columns) for row in rows)
+        self.row_count += len(rows)
+        if len(self.rows) >= SPILL_ROWS:
+            self.spill()
+
+    def sort_key(self, values):
+        # Same order as sort_values(key=str.lower): case-insensitive with empty values last
+        return tuple(part for i in self.positions for part in (values[i] is None, (values[i] or '').lower()))
+
+    def sort_rows(self):
+        if self.sort_by and self.rows:
+            with metrics.span('sort'):
+                self.rows.sort(key=self.sort_key)
+
+    def spill(self):
+        self.sort_rows()
+        run = tempfile.TemporaryFile()
+        for i in range(0, len(self.rows), SPILL_CHUNK_ROWS):
+            pickle.dump(self.rows[i:i + SPILL_CHUNK_ROWS], run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self.runs.append(run)
+        self.rows = []
+
+    def read_run(self, run):
+        try:
+            while True:
+                yield from pickle.load(run)
+        except EOFError:
+            pass
+        finally:
+            run.close()
+
+    def close(self, columns):
+        width = len(columns)
+        self.sort_rows()
+        runs = [self.read_run(run) for run in self.runs] + [iter(self.rows)]
+        if self.sort_by:
+            merged = heapq.merge(*runs, key=self.sort_key)
+        else:
+            merged = itertools.chain(*runs)
+        # Rows written before a column was discovered are padded one at a time on their way into the sheet
+        rows = (values + (None,) * (width - len(values)) for values in merged)
+        with metrics.span('excel_write'):
+            self.write_workbook(rows, columns)
+        self.rows = []
+        self.runs = []
+
+    def write_workbook(self, rows, columns):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import PatternFill, Font
+        from openpyxl.utils import get_column_letter
+        from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+        width = len(columns)
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(self.sheet_name)
+        for i, column in enumerate(columns, start=1):
+            worksheet.column_dimensions[get_column_letter(i)].width = max(len(column), int(self.widths.get(column, 0))) + 2
+
+        header_fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid")
+        header_font = Font(color="FFFFFF")
+        header = []
+        for column in columns:
+            cell = WriteOnlyCell(worksheet, value=column)
+            cell.fill = header_fill
+            cell.font = header_font
+            header.append(cell)
+        worksheet.append(header)
+
+        if self.row_count:
+            ref = f"A1:{get_column_letter(width)}{self.row_count + 1}"
+            table = Table(displayName=self.table_name, ref=ref)
+            table.tableColumns = [TableColumn(id=i, name=column) for i, column in enumerate(columns, start=1)]
+            table.tableStyleInfo = TableStyleInfo(name="TableStyleMedium15", showFirstColumn=False, showLastColumn=False, showRowStripes=True, showColumnStripes=True)
+            with warnings.catch_warnings():
+                # The write-only warning about table columns does not apply, they are set above
+                warnings.simplefilter("ignore")
+                worksheet.add_table(table)
+
+        for values in rows:
+            worksheet.append(values)
+        workbook.save(self.path)
+
+
+class CsvSink:
+    extension = ".csv.gz"
+
+    # Rows stream into a gzip body file. The header is only final at the end, so it is written as its own gzip
+    # member with the body appended after it. Rows written before a column was discovered end early.
+    def __init__(self, path):
+        self.path = path
+        self.body_path = path + ".body"
+        self.body = gzip.open(self.body_path, "wt", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.body)
+
+    def write_rows(self, rows, columns):
+        self.writer.writerows([row.get(column) for column in columns] for row in rows)
+
+    def close(self, columns):
+        self.body.close()
+        with open(self.path, "wb") as output:
+            with gzip.open(output, "wt", newline="", encoding="utf-8") as header:
+                csv.writer(header).writerow(columns)
+            with open(self.body_path, "rb") as body:
+                shutil.copyfileobj(body, output)
+        os.remove(self.body_path)
+
+
+class JsonlSink:
+    extension = ".jsonl"
+
+    def __init__(self, path):
+        self.output = open(path, "w", encoding="utf-8")
+
+    def write_rows(self, rows, columns):
+        self.output.writelines(json.dumps({k: v for k, v in row.items() if v is not None}) + "\n" for row in rows)
+
+    def close(self, columns):
+        self.output.close()
+
+
+class ParquetSink:
+    extension = ".parquet"
+
+    # Batches are kept as Arrow tables and unified into one schema once the columns are final. String columns
+    # are dictionary encoded since locations, types and tag values repeat heavily.
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export requires the 'pyarrow' package.")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.tables = []
+
+    def write_rows(self, rows, columns):
+        self.tables.append(self.pa.table({column: self.pa.array([row.get(column) for row in rows], type=self.pa.string()) for column in columns}))
+
+    def close(self, columns):
+        schema = self.pa.schema([(column, self.pa.dictionary(self.pa.int32(), self.pa.string())) for column in columns])
+        tables = []
+        for table in self.tables:
+            for column in columns[table.num_columns:]:
+                table = table.append_column(column, self.pa.nulls(table.num_rows, self.pa.string()))
+            tables.append(table.cast(schema))
+        self.tables = []
+        table = self.pa.concat_tables(tables) if tables else schema.empty_table()
+        self.pq.write_table(table, self.path, use_dictionary=True, compression="snappy")
+
+
+SINKS = {"xlsx": ExcelSink, "csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+class ExportPipeline:
+    def __init__(self, sinks, columns):
+        self.sinks = sinks
+        self.columns = list(columns)
+        self.known_columns = set(columns)
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        for row in rows:
+            if not self.known_columns.issuperset(row):
+                for column in row:
+                    if column not in self.known_columns:
+                        self.known_columns.add(column)
+                        self.columns.append(column)
+        for sink in self.sinks:
+            sink.write_rows(rows, self.columns)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close(self.columns)
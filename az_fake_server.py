@@ -0,0 +1,398 @@
+import re
+import sys
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs, urlencode
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+# Local stand-in for the Azure endpoints used by these scripts, so backends can be exercised offline.
+# Point the scripts at it with AZ_RESOURCE_GRAPH_ENDPOINT / AZ_ARM_ENDPOINT=http://127.0.0.1:<port> and a
+# FakeCredential. Besides Resource Graph it serves the ARM calls of the tagging scripts: resources.list and
+# list_by_resource_group (paged, with name/resourceType $filter), providers.list/get, get_by_id,
+# begin_update_by_id (202 + Location polling) and the Tags API, with optional latency and injected 429/5xx.
+
+FAKE_TYPES = [
+    "microsoft.compute/virtualmachines",
+    "microsoft.storage/storageaccounts",
+    "microsoft.network/virtualnetworks",
+    "microsoft.web/sites",
+    "microsoft.keyvault/vaults",
+    "microsoft.insights/components",
+    "microsoft.sql/servers",
+    "microsoft.sql/servers/databases",
+    "microsoft.mission/virtualenclaves"
+]
+FAKE_LOCATIONS = ["eastus", "westus", "northeurope", "australiaeast"]
+
+
+class FakeCredential:
+    def get_token(self, *scopes, **kwargs):
+        expires_on = int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp())
+        return SimpleNamespace(token="fake-token", expires_on=expires_on)
+
+
+def generate_resources(count, subscription_ids, resource_groups=20, seed=0):
+    rng = random.Random(seed)
+    resources = []
+    for i in range(count):
+        subscription_id = subscription_ids[i % len(subscription_ids)]
+        resource_group = f"rg-{i % resource_groups:03d}"
+        resource_type = rng.choice(FAKE_TYPES)
+        name = f"res-{i:07d}"
+        # Child types get a parent segment so the ID parses like a real one
+        parent = ''.join(f"{segment}/parent-{i % 10}/" for segment in resource_type.split('/')[1:-1])
+        tags = {key: f"{key}-{rng.randint(0, 9)}" for key in ["application", "owner", "cost-center", "environment"] if rng.random() < 0.8}
+        resources.append({
+            "id": f"/subscriptions/{subscription_id}/resourceGroups/{resource_group}/providers/{resource_type.split('/')[0]}/{parent}{resource_type.split('/')[-1]}/{name}",
+            "name": name,
+            "type": resource_type,
+            "kind": rng.choice([None, "StorageV2", "app"]),
+            "location": rng.choice(FAKE_LOCATIONS),
+            "subscriptionId": subscription_id,
+            "resourceGroup": resource_group,
+            "tags": tags
+        })
+    return resources
+
+
+def encode_skip_token(offset):
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def decode_skip_token(token):
+    return int(base64.urlsafe_b64decode(token.encode()).decode()) if token else 0
+
+
+def parse_kql_strings(text):
+    return [value.replace("\\'", "'").replace("\\\\", "\\") for value in re.findall(r"'((?:[^'\\]|\\.)*)'", text)]
+
+
+def parse_type_predicate(expression):
+    terms = []
+    for term in expression.split(" or "):
+        values = parse_kql_strings(term)
+        if term.startswith("type in~"):
+            exact = {v.lower() for v in values}
+            terms.append(lambda t, exact=exact: t in exact)
+        elif term.startswith("type startswith"):
+            terms.append(lambda t, prefix=values[0].lower(): t.startswith(prefix))
+        elif term.startswith("type matches regex"):
+            terms.append(lambda t, regex=re.compile(values[0]): bool(regex.match(t)))
+    return lambda t: any(term(t) for term in terms)
+
+
+def parse_where(query):
+    predicates = []
+    for line in query.splitlines():
+        if not line.startswith("| where "):
+            continue
+        expression = line[len("| where "):]
+        if expression.startswith("not(") and expression.endswith(")"):
+            predicate = parse_type_predicate(expression[4:-1])
+            predicates.append(lambda t, predicate=predicate: not predicate(t))
+        else:
+            predicates.append(parse_type_predicate(expression))
+    return lambda t: all(predicate(t.lower()) for predicate in predicates)
+
+
+class FakeResourceGraph:
+    # Understands the subset of KQL emitted by az_resource_graph: type filters, projection and count by subscription
+    def __init__(self, resources, max_page_size=1000):
+        self.resources = sorted(resources, key=lambda r: r["id"])
+        self.max_page_size = max_page_size
+        self.calls = 0
+
+    def query(self, body):
+        self.calls += 1
+        query = body.get("query", "")
+        options = body.get("options", {})
+        subscriptions = set(body.get("subscriptions") or [])
+
+        type_allowed = parse_where(query)
+        rows = [r for r in self.resources
+                if (not subscriptions or r["subscriptionId"] in subscriptions) and type_allowed(r["type"])]
+
+        if "summarize" in query:
+            counts = {}
+            for r in rows:
+                counts[r["subscriptionId"]] = counts.get(r["subscriptionId"], 0) + 1
+            data = [{"subscriptionId": s, "count_": c} for s, c in counts.items()]
+            return {"totalRecords": len(data), "count": len(data), "data": data, "resultTruncated": "false"}
+
+        tag_columns = re.findall(r"(\w+) = tags\[('(?:[^'\\]|\\.)*')\]", query)
+        offset = decode_skip_token(options.get("$skipToken"))
+        top = min(int(options.get("$top", self.max_page_size)), self.max_page_size)
+        data = []
+        for r in rows[offset:offset + top]:
+            record = {key: r.get(key) for key in ["id", "name", "type", "kind", "location", "subscriptionId"]}
+            for column, key in tag_columns:
+                record[column] = r["tags"].get(parse_kql_strings(key)[0])
+            if re.search(r"\| project .*\btags\s*(,|$)", query, re.M):
+                record["tags"] = r["tags"]
+            data.append(record)
+        result = {"totalRecords": len(rows), "count": len(data), "data": data, "resultTruncated": "false"}
+        if offset + top < len(rows):
+            result["$skipToken"] = encode_skip_token(offset + top)
+        return result
+
+
+TAGS_PATH_SUFFIX = "/providers/microsoft.resources/tags/default"
+FAKE_API_VERSIONS = ["2024-01-01-preview", "2023-01-01", "2022-09-01"]
+REMAINING_WRITES = "1199"
+
+
+def parse_arm_filter(text):
+    # Supports the "name eq '...'" and "resourceType eq '...' or ..." filters the scripts send
+    terms = re.findall(r"(name|resourceType) eq '((?:[^']|'')*)'", text or "")
+    names = {value.replace("''", "'").lower() for field, value in terms if field == "name"}
+    types = {value.replace("''", "'").lower() for field, value in terms if field == "resourceType"}
+    return lambda r: (not names or r["name"].lower() in names) and (not types or r["type"].lower() in types)
+
+
+def resource_body(resource):
+    return {key: resource.get(key) for key in ["id", "name", "type", "kind", "location", "tags"]}
+
+
+class FakeArm:
+    def __init__(self, resources, page_size=1000, latency=0.0, throttle_rate=0.0, error_rate=0.0, retry_after=0,
+                 lro_polls=1, seed=0):
+        # lro_polls: number of 202 answers a resource update's Location returns before completing (0 = synchronous)
+        self.resources = {r["id"].lower(): r for r in sorted(resources, key=lambda r: r["id"])}
+        self.by_group = {}
+        self.by_subscription = {}
+        for r in self.resources.values():
+            self.by_subscription.setdefault(r["subscriptionId"].lower(), []).append(r)
+            self.by_group.setdefault((r["subscriptionId"].lower(), r["resourceGroup"].lower()), []).append(r)
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.lro_polls = lro_polls
+        self.operations = {}
+        self.calls = {}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def count(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def fault(self):
+        with self.lock:
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            self.count("throttled")
+            return 429, {"Retry-After": str(self.retry_after)}, {"error": {"code": "TooManyRequests", "message": "Throttled"}}
+        if roll < self.throttle_rate + self.error_rate:
+            self.count("server_errors")
+            return 503, {}, {"error": {"code": "ServiceUnavailable", "message": "Injected failure"}}
+        return None
+
+    def page(self, endpoint, resources, query, url):
+        self.count(endpoint)
+        allowed = parse_arm_filter(query.get("$filter", [None])[0])
+        rows = [r for r in resources if allowed(r)]
+        offset = decode_skip_token(query.get("$skiptoken", [None])[0])
+        top = min(int(query.get("$top", [self.page_size])[0]), self.page_size)
+        payload = {"value": [resource_body(r) for r in rows[offset:offset + top]]}
+        if offset + top < len(rows):
+            next_query = {key: values[0] for key, values in query.items() if key != "$skiptoken"}
+            next_query["$skiptoken"] = encode_skip_token(offset + top)
+            payload["nextLink"] = f"{url}?{urlencode(next_query)}"
+        return 200, {}, payload
+
+    def providers(self):
+        namespaces = {}
+        for resource_type in FAKE_TYPES:
+            namespace, rest = resource_type.split("/", 1)
+            namespaces.setdefault(namespace, []).append({"resourceType": rest, "apiVersions": FAKE_API_VERSIONS})
+        return [{"id": f"/providers/{namespace}", "namespace": namespace, "registrationState": "Registered", "resourceTypes": types}
+                for namespace, types in namespaces.items()]
+
+    def get(self, path, query, base_url):
+        lowered = path.lower().rstrip("/")
+        parts = lowered.strip("/").split("/")
+        if lowered.endswith(TAGS_PATH_SUFFIX):
+            self.count("tags.get_at_scope")
+            resource = self.resources.get(lowered[:-len(TAGS_PATH_SUFFIX)])
+            return (200, {}, self.tags_body(resource)) if resource else self.not_found(path)
+        if parts[0] == "operations":
+            return self.poll_operation(parts[1], base_url)
+        if len(parts) == 3 and parts[2] == "resources":
+            return self.page("resources.list", self.by_subscription.get(parts[1], []), query, base_url + path)
+        if len(parts) == 5 and parts[2] == "resourcegroups" and parts[4] == "resources":
+            return self.page("resources.list_by_resource_group", self.by_group.get((parts[1], parts[3]), []), query, base_url + path)
+        if len(parts) == 3 and parts[2] == "providers":
+            self.count("providers.list")
+            return 200, {}, {"value": self.providers()}
+        if len(parts) == 4 and parts[2] == "providers":
+            self.count("providers.get")
+            provider = next((p for p in self.providers() if p["namespace"] == parts[3]), None)
+            return (200, {}, provider) if provider else self.not_found(path)
+        self.count("resources.get_by_id")
+        resource = self.resources.get(lowered)
+        if resource is None:
+            return self.not_found(path)
+        return 200, {}, {**resource_body(resource), "properties": {"provisioningState": "Succeeded"}}
+
+    def update(self, path, body, base_url):
+        lowered = path.lower().rstrip("/")
+        headers = {"x-ms-ratelimit-remaining-subscription-writes": REMAINING_WRITES}
+        if lowered.endswith(TAGS_PATH_SUFFIX):
+            self.count("tags.update_at_scope")
+            resource = self.resources.get(lowered[:-len(TAGS_PATH_SUFFIX)])
+            if resource is None:
+                return self.not_found(path)
+            tags = (body.get("properties") or {}).get("tags") or {}
+            operation = body.get("operation", "Merge")
+            with self.lock:
+                if operation == "Replace":
+                    resource["tags"] = dict(tags)
+                elif operation == "Delete":
+                    resource["tags"] = {k: v for k, v in resource["tags"].items() if k not in tags or tags[k] not in (None, "", v)}
+                else:
+                    resource["tags"] = {**resource["tags"], **tags}
+            return 200, headers, self.tags_body(resource)
+        self.count("resources.update_by_id")
+        resource = self.resources.get(lowered)
+        if resource is None:
+            return self.not_found(path)
+        with self.lock:
+            if "tags" in body:
+                resource["tags"] = dict(body["tags"] or {})
+            if self.lro_polls:
+                operation_id = uuid.uuid4().hex
+                self.operations[operation_id] = [self.lro_polls, lowered]
+                headers.update({"Location": f"{base_url}/operations/{operation_id}", "Retry-After": "0"})
+                return 202, headers, {}
+        return 200, headers, {**resource_body(resource), "properties": {"provisioningState": "Succeeded"}}
+
+    def poll_operation(self, operation_id, base_url):
+        self.count("operations.get")
+        with self.lock:
+            operation = self.operations.get(operation_id)
+            if operation is None:
+                return self.not_found(operation_id)
+            operation[0] -= 1
+            if operation[0] > 0:
+                return 202, {"Location": f"{base_url}/operations/{operation_id}", "Retry-After": "0"}, {}
+            del self.operations[operation_id]
+            resource = self.resources[operation[1]]
+        return 200, {}, {**resource_body(resource), "properties": {"provisioningState": "Succeeded"}}
+
+    def tags_body(self, resource):
+        return {"id": resource["id"] + "/providers/Microsoft.Resources/tags/default", "name": "default",
+                "type": "Microsoft.Resources/tags", "properties": {"tags": resource["tags"]}}
+
+    def not_found(self, path):
+        return 404, {}, {"error": {"code": "ResourceNotFound", "message": f"'{path}' was not found"}}
+
+
+class FakeAzureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            # Clients exiting with keep-alive connections still open
+            pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def arm_request(self, method):
+        url = urlsplit(self.path)
+        arm = self.server.arm
+        body = self.read_json() if method != "GET" else {}
+        if arm.latency:
+            time.sleep(arm.latency)
+        base_url = f"http://{self.headers.get('Host')}"
+        response = arm.fault() if not url.path.lower().startswith("/operations/") else None
+        if response is None:
+            if method == "GET":
+                response = arm.get(url.path, parse_qs(url.query), base_url)
+            else:
+                response = arm.update(url.path, body, base_url)
+        status, headers, payload = response
+        self.send_json(status, payload, headers)
+
+    def do_GET(self):
+        self.arm_request("GET")
+
+    def do_PATCH(self):
+        self.arm_request("PATCH")
+
+    def do_PUT(self):
+        self.arm_request("PUT")
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if path.lower() == "/providers/microsoft.resourcegraph/resources":
+            query = self.read_json()
+            response = self.server.arm.fault()
+            if response is not None and response[0] == 429:
+                # Resource Graph reports its per-user quota instead of Retry-After
+                reset = int(self.server.arm.retry_after)
+                response = 429, {"x-ms-user-quota-remaining": "0", "x-ms-user-quota-resets-after": f"00:{reset // 60:02d}:{reset % 60:02d}"}, response[2]
+            self.send_json(*(response or (200, self.server.resource_graph.query(query))))
+        else:
+            self.send_json(404, {"error": {"code": "NotFound", "message": path}})
+
+
+def serve(resources, host="127.0.0.1", port=0, max_page_size=1000, **arm_options):
+    # arm_options: latency, throttle_rate, error_rate, retry_after, lro_polls and seed of FakeArm
+    server = ThreadingHTTPServer((host, port), FakeAzureHandler)
+    server.daemon_threads = True
+    server.resource_graph = FakeResourceGraph(resources, max_page_size)
+    server.arm = FakeArm(resources, page_size=max_page_size, **arm_options)
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local fake Azure endpoint for offline testing.")
+    parser.add_argument("--resources", type=int, default=1000)
+    parser.add_argument("--subscriptions", nargs="+", default=["00000000-0000-0000-0000-000000000000"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every ARM request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of ARM requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of ARM requests answered with 503")
+    parser.add_argument("--lro-polls", type=int, default=1, help="202 responses before a resource update completes")
+    args = parser.parse_args(argv)
+
+    server = serve(generate_resources(args.resources, args.subscriptions), port=args.port, max_page_size=args.page_size,
+                   latency=args.latency, throttle_rate=args.throttle_rate, error_rate=args.error_rate, lro_polls=args.lro_polls)
+    print(f"Fake Azure endpoint listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import os
+from az_cache import cache_path
+
+# Button icons are resized once and cached as PNG next to the other caches, so later starts load them
+# straight into Tk without PIL. The cache is rebuilt when an icon in icons/ changes.
+ICON_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icons')
+ICON_SIZE = 20
+
+
+def icon_file(name, size=ICON_SIZE):
+    source = os.path.join(ICON_DIRECTORY, f"{name}.jpg")
+    cached = cache_path(f"icon_{name}_{size}.png")
+    if not os.path.exists(cached) or os.path.getmtime(cached) < os.path.getmtime(source):
+        from PIL import Image
+        Image.open(source).resize((size, size), Image.LANCZOS).save(cached + '.tmp', 'PNG')
+        os.replace(cached + '.tmp', cached)
+    return cached
+
+
+def load_icons(names, size=ICON_SIZE):
+    import tkinter as tk
+    return {name: tk.PhotoImage(file=icon_file(name, size)) for name in set(names)}
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, InvalidStateError
+from azure.core.exceptions import HttpResponseError
+from azure.core.rest import HttpRequest
+
+# Long-running operations are started with polling disabled and handed to one scheduler, which polls every
+# pending operation from a small thread pool at the interval the service suggests through Retry-After.
+LRO_POLL_INTERVAL = float(os.environ.get('AZ_LRO_POLL_INTERVAL', 1))
+LRO_POLL_WORKERS = int(os.environ.get('AZ_LRO_POLL_WORKERS', 4))
+LRO_MAX_POLL_ERRORS = 5
+# An operation still not in a terminal state after this many seconds (including one whose status the
+# scheduler does not recognize) fails instead of being polled forever
+LRO_TIMEOUT = float(os.environ.get('AZ_LRO_TIMEOUT', 1800))
+TERMINAL_STATES = {'succeeded', 'failed', 'canceled', 'cancelled'}
+
+
+def retry_after(headers, default):
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return default
+
+
+def read_json(response):
+    try:
+        return json.loads(response.text() or '{}')
+    except ValueError:
+        return {}
+
+
+def send_request(client, request):
+    # The multi-API ResourceManagementClient only exposes its ARM pipeline through _client
+    sender = getattr(client, 'send_request', None) or client._client.send_request
+    return sender(request)
+
+
+def set_future(future, result=None, error=None):
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class PendingOperation:
+    def __init__(self, client, url, mode, future, result, timeout=LRO_TIMEOUT):
+        self.client = client
+        self.url = url
+        self.mode = mode
+        self.future = future
+        self.result = result
+        self.errors = 0
+        self.deadline = time.monotonic() + timeout
+
+
+class LroScheduler:
+    def __init__(self, poll_workers=LRO_POLL_WORKERS, default_interval=LRO_POLL_INTERVAL, timeout=LRO_TIMEOUT):
+        self.default_interval = default_interval
+        self.timeout = timeout
+        self.poll_workers = poll_workers
+        self.pollers = None
+        self.queue = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def begin(self, client, start, raw_response_hook=None, **kwargs):
+        # start(**kwargs) issues the initial request of an LRO; returns a Future resolved when the operation completes
+        captured = {}
+
+        def hook(response):
+            captured['response'] = response.http_response
+            if raw_response_hook:
+                raw_response_hook(response)
+
+        result = start(polling=False, raw_response_hook=hook, **kwargs).result()
+        future = Future()
+        response = captured.get('response')
+        if response is None:
+            future.set_result(result)
+            return future
+
+        headers = response.headers
+        body = read_json(response)
+        state = ((body.get('properties') or {}).get('provisioningState') or '').lower()
+        if headers.get('Azure-AsyncOperation'):
+            operation = PendingOperation(client, headers['Azure-AsyncOperation'], 'async', future, result, self.timeout)
+        elif headers.get('Location') and response.status_code == 202:
+            operation = PendingOperation(client, headers['Location'], 'location', future, result, self.timeout)
+        elif response.status_code in (200, 201) and state and state not in TERMINAL_STATES:
+            operation = PendingOperation(client, response.request.url, 'resource', future, result, self.timeout)
+        else:
+            future.set_result(result if result is not None else True)
+            return future
+        self.schedule(operation, retry_after(headers, self.default_interval))
+        return future
+
+    def schedule(self, operation, delay):
+        with self.condition:
+            if self.thread is None:
+                self.pollers = ThreadPoolExecutor(max_workers=self.poll_workers)
+                self.thread = threading.Thread(target=self.dispatch, name="LroScheduler", daemon=True)
+                self.thread.start()
+            heapq.heappush(self.queue, (time.monotonic() + delay, next(self.counter), operation))
+            self.condition.notify()
+
+    def dispatch(self):
+        while True:
+            with self.condition:
+                while not self.queue or self.queue[0][0] > time.monotonic():
+                    self.condition.wait(self.queue[0][0] - time.monotonic() if self.queue else None)
+                _, _, operation = heapq.heappop(self.queue)
+            if not operation.future.cancelled():
+                self.pollers.submit(self.poll, operation)
+
+    def poll(self, operation):
+        try:
+            response = send_request(operation.client, HttpRequest("GET", operation.url))
+        except Exception as e:
+            return self.poll_failed(operation, e)
+        headers = response.headers
+        delay = retry_after(headers, self.default_interval)
+        if response.status_code == 429 or response.status_code >= 500:
+            return self.poll_failed(operation, HttpResponseError(response=response), delay)
+        if response.status_code >= 400:
+            return set_future(operation.future, error=HttpResponseError(response=response))
+        operation.errors = 0
+
+        if operation.mode == 'location':
+            if response.status_code == 202:
+                return self.reschedule(operation, delay, 'accepted')
+            body = read_json(response)
+            return set_future(operation.future, body or operation.result or True)
+
+        body = read_json(response)
+        state = (body.get('status') if operation.mode == 'async' else (body.get('properties') or {}).get('provisioningState')) or ''
+        if state.lower() not in TERMINAL_STATES:
+            return self.reschedule(operation, delay, f"in state '{state}'" if state else "without a status")
+        if state.lower() != 'succeeded':
+            error = (body.get('error') or {}).get('message') or state
+            return set_future(operation.future, error=HttpResponseError(message=f"Operation {state}: {error}"))
+        set_future(operation.future, operation.result if operation.result is not None else True)
+
+    def reschedule(self, operation, delay, state):
+        if time.monotonic() + delay > operation.deadline:
+            return set_future(operation.future, error=TimeoutError(f"Operation {operation.url} still {state} after {self.timeout:g}s"))
+        self.schedule(operation, delay)
+
+    def poll_failed(self, operation, error, delay=None):
+        operation.errors += 1
+        if operation.errors >= LRO_MAX_POLL_ERRORS:
+            return set_future(operation.future, error=error)
+        self.schedule(operation, delay if delay is not None else min(60, self.default_interval * 2 ** operation.errors))
+
+
+lro_scheduler = LroScheduler()
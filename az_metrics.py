@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Timing spans per phase, HTTP call and byte counters per endpoint, and optional cProfile capture (AZ_PROFILE=1).
+# At the end of a run finish() logs a summary table and writes the counters in the Prometheus text format
+# to <script name>.prom in AZ_METRICS_DIR, where a node_exporter textfile collector can pick them up.
+METRICS_DIRECTORY = os.environ.get('AZ_METRICS_DIR', os.path.join(os.path.expanduser("~"), "ResourceTagLogs"))
+METRIC_PREFIX = 'az_tagging'
+PROFILE = os.environ.get('AZ_PROFILE', '0') == '1'
+PROFILE_TOP_FUNCTIONS = 25
+
+
+def endpoint_name(url):
+    parts = urlsplit(url).path.lower().strip('/').split('/')
+    path = '/'.join(parts)
+    if path.endswith('providers/microsoft.resources/tags/default'):
+        return 'tags'
+    if path.endswith('providers/microsoft.resourcegraph/resources'):
+        return 'resource_graph'
+    if any('operation' in part for part in parts):
+        return 'operations'
+    if parts[-1] == 'resources':
+        return 'resources.list_by_resource_group' if 'resourcegroups' in parts else 'resources.list'
+    if parts[0] == 'subscriptions' and len(parts) in (3, 4) and parts[2] == 'providers':
+        return 'providers'
+    if 'providers' in parts:
+        return 'resource'
+    return 'other'
+
+
+def script_name():
+    return os.path.splitext(os.path.basename(sys.argv[0]))[0] if sys.argv and sys.argv[0] else 'python'
+
+
+def label_text(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class Metrics:
+    def __init__(self):
+        # name -> [count, total seconds, max seconds]
+        self.spans = {}
+        # (name, ((label, value), ...)) -> value
+        self.counters = {}
+        self.profiler = None
+        # Startup cost: time from loading this module (the first thing az_cli.py does) to the first API response
+        self.created = time.perf_counter()
+        self.first_response = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        # Between jobs of a long-running process
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            span = self.spans.setdefault(name, [0, 0.0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+            span[2] = max(span[2], seconds)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name, iterable):
+        # Times each next() of an iterator, e.g. fetching the pages of a paged list
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(name, time.perf_counter() - started)
+            yield item
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_http(self, method, url, status, sent=0, received=0):
+        with self.lock:
+            first = self.first_response is None
+            if first:
+                self.first_response = time.perf_counter() - self.created
+        if first:
+            self.observe('start_to_first_response', self.first_response)
+        endpoint = endpoint_name(url)
+        self.count('http_requests', method=method, endpoint=endpoint, status=status)
+        self.count('http_request_bytes', sent, endpoint=endpoint)
+        self.count('http_response_bytes', received, endpoint=endpoint)
+
+    def start_profile(self):
+        # cProfile only sees the thread it was started in
+        if PROFILE and self.profiler is None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profile(self, path, log):
+        import io
+        import pstats
+        self.profiler.disable()
+        self.profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        self.profiler = None
+        log(f"Profile written to {path}")
+        for line in output.getvalue().splitlines():
+            if line.strip():
+                log(line)
+
+    def summary(self):
+        with self.lock:
+            spans = dict(self.spans)
+            counters = dict(self.counters)
+        lines = [f"{'Phase':<28}{'count':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}"]
+        for name, (count, total, longest) in sorted(spans.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<28}{count:>8}{total:>10.2f}{total / count * 1000:>10.1f}{longest * 1000:>10.1f}")
+        endpoints = {}
+        for (name, labels), value in counters.items():
+            labels = dict(labels)
+            if name.startswith('http_'):
+                endpoint = endpoints.setdefault(labels['endpoint'], {'calls': 0, 'errors': 0, 'sent': 0, 'received': 0})
+                if name == 'http_requests':
+                    endpoint['calls'] += value
+                    if labels['status'] == 'error' or labels['status'] >= 400:
+                        endpoint['errors'] += value
+                else:
+                    endpoint['sent' if name == 'http_request_bytes' else 'received'] += value
+        if endpoints:
+            lines.append(f"{'Endpoint':<36}{'calls':>8}{'errors':>8}{'sent KB':>10}{'recv KB':>10}")
+            for name, endpoint in sorted(endpoints.items(), key=lambda item: -item[1]['calls']):
+                lines.append(f"{name:<36}{endpoint['calls']:>8}{endpoint['errors']:>8}{endpoint['sent'] / 1024:>10.1f}{endpoint['received'] / 1024:>10.1f}")
+        return lines
+
+    def prometheus(self):
+        with self.lock:
+            spans = dict(self.spans)
+            counters = dict(self.counters)
+        lines = []
+        for metric, position, kind in [('phase_seconds_total', 1, 'counter'), ('phase_calls_total', 0, 'counter'), ('phase_max_seconds', 2, 'gauge')]:
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} {kind}")
+            for name, values in sorted(spans.items()):
+                lines.append(f"{METRIC_PREFIX}_{metric}{label_text([('phase', name)])} {values[position]:.6g}")
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+            for (counter, labels), value in sorted(counters.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+                if counter == name:
+                    lines.append(f"{METRIC_PREFIX}_{name}_total{label_text(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as file:
+            file.write(self.prometheus())
+        os.replace(temp_path, path)
+
+    def finish(self, name=None, log=print):
+        name = name or script_name()
+        os.makedirs(METRICS_DIRECTORY, exist_ok=True)
+        if self.profiler:
+            self.stop_profile(os.path.join(METRICS_DIRECTORY, f"{name}.prof"), log)
+        for line in self.summary():
+            log(line)
+        path = os.path.join(METRICS_DIRECTORY, f"{name}.prom")
+        self.write_prometheus(path)
+        log(f"Metrics written to {path}")
+        return path
+
+
+metrics = Metrics()
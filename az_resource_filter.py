@@ -0,0 +1,112 @@
+import os
+import re
+import json
+
+# Rules are matched case-insensitively against resource types such as 'microsoft.web/sites':
+#   'microsoft.web/sites'   exact type
+#   'microsoft.mission/*'   every type starting with the prefix before the trailing '*'
+#   'microsoft.*/servers'   glob with '*' and '?' anywhere else
+DEFAULT_FILTER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource_filters.json')
+GLOB_CHARS = set('*?')
+END = ''
+
+
+def glob_to_regex(pattern):
+    return '^' + ''.join('.*' if ch == '*' else '.' if ch == '?' else re.escape(ch) for ch in pattern) + '$'
+
+
+def quote_kql(value):
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+class PrefixTrie:
+    def __init__(self, prefixes=()):
+        self.root = {}
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def add(self, prefix):
+        node = self.root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[END] = True
+
+    def matches(self, value):
+        node = self.root
+        if END in node:
+            return True
+        for ch in value:
+            node = node.get(ch)
+            if node is None:
+                return False
+            if END in node:
+                return True
+        return False
+
+
+class TypeRuleSet:
+    def __init__(self, rules):
+        self.exact, self.prefixes, self.globs = set(), [], []
+        for rule in rules:
+            rule = rule.strip().lower()
+            if not rule:
+                continue
+            if rule.endswith('*') and not GLOB_CHARS & set(rule[:-1]):
+                self.prefixes.append(rule[:-1])
+            elif GLOB_CHARS & set(rule):
+                self.globs.append(rule)
+            else:
+                self.exact.add(rule)
+        self.trie = PrefixTrie(self.prefixes)
+        self.glob_regex = re.compile('|'.join(glob_to_regex(g) for g in self.globs)) if self.globs else None
+
+    def __bool__(self):
+        return bool(self.exact or self.prefixes or self.globs)
+
+    def matches(self, resource_type):
+        if resource_type in self.exact or self.trie.matches(resource_type):
+            return True
+        return bool(self.glob_regex and self.glob_regex.match(resource_type))
+
+    def to_kql(self):
+        terms = []
+        if self.exact:
+            terms.append(f"type in~ ({', '.join(quote_kql(t) for t in sorted(self.exact))})")
+        terms.extend(f"type startswith {quote_kql(p)}" for p in self.prefixes)
+        terms.extend(f"type matches regex {quote_kql('(?i)' + glob_to_regex(g))}" for g in self.globs)
+        return ' or '.join(terms)
+
+
+class ResourceTypeFilter:
+    def __init__(self, include=(), exclude=()):
+        self.include = TypeRuleSet(include)
+        self.exclude = TypeRuleSet(exclude)
+
+    @classmethod
+    def from_file(cls, path=None):
+        path = path or os.environ.get('AZ_RESOURCE_FILTERS', DEFAULT_FILTER_FILE)
+        with open(path) as filter_file:
+            rules = json.load(filter_file)
+        return cls(rules.get('include', []), rules.get('exclude', []))
+
+    def allows(self, resource_type):
+        if not resource_type:
+            return not self.include
+        resource_type = resource_type.lower()
+        if self.include and not self.include.matches(resource_type):
+            return False
+        return not self.exclude.matches(resource_type)
+
+    def to_kql(self):
+        where = []
+        if self.include:
+            where.append(f"| where {self.include.to_kql()}")
+        if self.exclude:
+            where.append(f"| where not({self.exclude.to_kql()})")
+        return where
+
+    def to_arm_filter(self):
+        # ARM's $filter only supports "resourceType eq" terms, so just exact include lists can be pushed down
+        if not self.include or self.include.prefixes or self.include.globs:
+            return None
+        return ' or '.join(f"resourceType eq '{t}'" for t in sorted(self.include.exact))
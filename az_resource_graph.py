@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import random
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+from az_resource_filter import quote_kql
+from az_metrics import metrics
+
+RESOURCE_GRAPH_ENDPOINT = "https://management.azure.com"
+RESOURCE_GRAPH_API_VERSION = "2021-03-01"
+PAGE_SIZE = 1000
+# Throttled (429) and failed (5xx) queries are retried after the quota reset the service reports, or with backoff
+RESOURCE_GRAPH_MAX_RETRIES = int(os.environ.get("AZ_RESOURCE_GRAPH_MAX_RETRIES", 5))
+TAG_KEYS = ["application", "owner", "cost-center", "environment"]
+
+
+def tag_column(tag_key):
+    return "tag_" + tag_key.replace("-", "_")
+
+
+def retry_delay(headers, attempt):
+    # Retry-After in seconds, or the user quota reset of Resource Graph as hh:mm:ss
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        pass
+    try:
+        hours, minutes, seconds = headers.get("x-ms-user-quota-resets-after").split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (AttributeError, ValueError):
+        return min(60, 2 ** attempt)
+
+
+def build_where(type_filter):
+    return type_filter.to_kql() if type_filter else []
+
+
+def build_query(type_filter, tag_keys=TAG_KEYS):
+    # Only the exported columns come back; missing tags are projected as null. Without tag_keys the whole tag bag is returned.
+    tag_columns = ", ".join(f"{tag_column(key)} = tags[{quote_kql(key)}]" for key in tag_keys) if tag_keys is not None else "tags"
+    return "\n".join(["Resources"] + build_where(type_filter) + [
+        f"| project id, name, type, kind, location, subscriptionId, {tag_columns}",
+        "| order by id asc"
+    ])
+
+
+def build_count_query(type_filter):
+    return "\n".join(["Resources"] + build_where(type_filter) + ["| summarize count_ = count() by subscriptionId"])
+
+
+class ResourceGraphBackend:
+    def __init__(self, credential, endpoint=None, page_size=PAGE_SIZE, tag_keys=TAG_KEYS, max_retries=RESOURCE_GRAPH_MAX_RETRIES):
+        self.credential = credential
+        self.endpoint = (endpoint or os.environ.get("AZ_RESOURCE_GRAPH_ENDPOINT", RESOURCE_GRAPH_ENDPOINT)).rstrip("/")
+        self.page_size = page_size
+        self.tag_keys = tag_keys
+        self.max_retries = max_retries
+
+    def query(self, subscription_ids, query, skip_token=None):
+        options = {"$top": self.page_size, "resultFormat": "objectArray"}
+        if skip_token:
+            options["$skipToken"] = skip_token
+        body = json.dumps({"subscriptions": list(subscription_ids), "query": query, "options": options}).encode("utf-8")
+        attempt = 0
+        while True:
+            token = self.credential.get_token(f"{RESOURCE_GRAPH_ENDPOINT}/.default").token
+            request = urllib.request.Request(
+                f"{self.endpoint}/providers/Microsoft.ResourceGraph/resources?api-version={RESOURCE_GRAPH_API_VERSION}",
+                data=body,
+                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
+                method="POST"
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    payload = response.read()
+            except urllib.error.HTTPError as e:
+                metrics.record_http("POST", request.full_url, e.code, sent=len(body))
+                if attempt >= self.max_retries or not (e.code == 429 or 500 <= e.code < 600):
+                    raise
+                # Concurrent subscription queries share the quota, the jitter spreads out their retries
+                time.sleep(retry_delay(e.headers, attempt) * random.uniform(1.0, 1.2))
+                attempt += 1
+                continue
+            metrics.record_http("POST", request.full_url, response.status, sent=len(body), received=len(payload))
+            return json.loads(payload)
+
+    def to_resource(self, record):
+        if self.tag_keys is None:
+            tags = record.get("tags")
+        else:
+            tags = {key: record.get(tag_column(key)) for key in self.tag_keys if record.get(tag_column(key)) is not None}
+        return SimpleNamespace(
+            id=record.get("id"),
+            name=record.get("name"),
+            type=record.get("type"),
+            kind=record.get("kind") or None,
+            location=record.get("location"),
+            subscription_id=record.get("subscriptionId"),
+            tags=tags or None
+        )
+
+    def list_pages(self, subscription_ids, type_filter=None):
+        query = build_query(type_filter, self.tag_keys)
+        skip_token = None
+        while True:
+            result = self.query(subscription_ids, query, skip_token)
+            yield [self.to_resource(record) for record in result.get("data", [])]
+            skip_token = result.get("$skipToken")
+            if not skip_token:
+                break
+
+    def count_by_subscription(self, subscription_ids, type_filter=None):
+        result = self.query(subscription_ids, build_count_query(type_filter))
+        return {record["subscriptionId"]: record["count_"] for record in result.get("data", [])}
@@ -0,0 +1,104 @@
+import os
+import glob
+import bisect
+import threading
+import pandas as pd
+
+# Name -> ID index of the latest inventory written by Get_AZ_Resources.py, also used for autocompletion.
+# Lookups are case-insensitive; completion lists are kept sorted and searched by prefix with bisect.
+INVENTORY_DIRECTORY = os.environ.get('AZ_INVENTORY_DIR', 'exports')
+# When one export was written in several formats, the fastest to read is used
+INVENTORY_FORMATS = ['.parquet', '.jsonl', '.csv.gz', '.xlsx']
+INDEX_COLUMNS = ['SUBSCRIPTION_ID', 'RESOURCE_GROUP', 'RESOURCE_NAME', 'ID']
+MAX_COMPLETIONS = 50
+FULL_EXPORT_HINT = f"No full inventory export found in '{INVENTORY_DIRECTORY}'; run 'python az_cli.py export --mode full' first."
+
+
+def latest_inventory(directory=INVENTORY_DIRECTORY):
+    # Only full exports match; the _Inventory_Delta.jsonl change reports are skipped
+    exports = {}
+    for path in glob.glob(os.path.join(directory, '*_Inventory*')):
+        for extension in INVENTORY_FORMATS:
+            if path.endswith('_Inventory' + extension):
+                exports.setdefault(path[:-len(extension)], []).append(path)
+    if not exports:
+        return None
+    newest = max(exports.values(), key=lambda paths: max(os.path.getmtime(path) for path in paths))
+    return min(newest, key=lambda path: next(i for i, extension in enumerate(INVENTORY_FORMATS) if path.endswith(extension)))
+
+
+def read_inventory(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=INDEX_COLUMNS)
+    if path.endswith('.jsonl'):
+        return pd.read_json(path, lines=True, dtype=False)[INDEX_COLUMNS]
+    if path.endswith('.csv.gz'):
+        return pd.read_csv(path, usecols=INDEX_COLUMNS, dtype=str)
+    return pd.read_excel(path, usecols=INDEX_COLUMNS, dtype=str)
+
+
+def insert_sorted(values, value):
+    entry = (value.lower(), value)
+    position = bisect.bisect_left(values, entry)
+    if position == len(values) or values[position] != entry:
+        values.insert(position, entry)
+
+
+def complete(values, prefix, limit=MAX_COMPLETIONS):
+    prefix = prefix.lower()
+    position = bisect.bisect_left(values, (prefix,))
+    matches = []
+    for lowered, value in values[position:position + limit]:
+        if not lowered.startswith(prefix):
+            break
+        matches.append(value)
+    return matches
+
+
+class ResourceIndex:
+    def __init__(self):
+        self.ids = {}
+        self.subscriptions = []
+        self.resource_groups = {}
+        self.resource_names = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_inventory(cls, path=None):
+        index = cls()
+        path = path or latest_inventory()
+        if not path:
+            return index
+        subscriptions, resource_groups, resource_names = set(), {}, {}
+        for subscription_id, resource_group, resource_name, resource_id in read_inventory(path).dropna().itertuples(index=False):
+            subscription_key, group_key = subscription_id.lower(), resource_group.lower()
+            index.ids.setdefault((subscription_key, group_key, resource_name.lower()), []).append(resource_id)
+            subscriptions.add(subscription_id)
+            resource_groups.setdefault(subscription_key, set()).add(resource_group)
+            resource_names.setdefault((subscription_key, group_key), set()).add(resource_name)
+        # Sorted once here, add() keeps them sorted afterwards
+        index.subscriptions = sorted((value.lower(), value) for value in subscriptions)
+        index.resource_groups = {key: sorted((value.lower(), value) for value in values) for key, values in resource_groups.items()}
+        index.resource_names = {key: sorted((value.lower(), value) for value in values) for key, values in resource_names.items()}
+        return index
+
+    def add(self, subscription_id, resource_group, resource_name, resource_id):
+        with self.lock:
+            ids = self.ids.setdefault((subscription_id.lower(), resource_group.lower(), resource_name.lower()), [])
+            if resource_id not in ids:
+                ids.append(resource_id)
+            insert_sorted(self.subscriptions, subscription_id)
+            insert_sorted(self.resource_groups.setdefault(subscription_id.lower(), []), resource_group)
+            insert_sorted(self.resource_names.setdefault((subscription_id.lower(), resource_group.lower()), []), resource_name)
+
+    def find(self, subscription_id, resource_group, resource_name):
+        return list(self.ids.get((subscription_id.lower(), resource_group.lower(), resource_name.lower()), []))
+
+    def complete_subscription(self, prefix):
+        return complete(self.subscriptions, prefix)
+
+    def complete_resource_group(self, subscription_id, prefix):
+        return complete(self.resource_groups.get(subscription_id.lower(), []), prefix)
+
+    def complete_resource_name(self, subscription_id, resource_group, prefix):
+        return complete(self.resource_names.get((subscription_id.lower(), resource_group.lower()), []), prefix)
@@ -0,0 +1,85 @@
+from azure.core.exceptions import ResourceNotFoundError
+from az_api_versions import api_versions
+from az_session import azure_session
+
+
+def parse_resource_id(resource_id):
+    # '/subscriptions/<sub>/resourceGroups/<rg>/providers/<namespace>/<type>/<name>[/<child type>/<child name>]'
+    parts = resource_id.strip('/').split('/')
+    lowered = [part.lower() for part in parts]
+    subscription_id = parts[lowered.index('subscriptions') + 1] if 'subscriptions' in lowered else None
+    resource_group = parts[lowered.index('resourcegroups') + 1] if 'resourcegroups' in lowered else None
+    resource_type = None
+    if 'providers' in lowered:
+        start = len(lowered) - 1 - lowered[::-1].index('providers')
+        namespace, rest = parts[start + 1], parts[start + 2:]
+        resource_type = '/'.join([namespace] + rest[0::2])
+    return subscription_id, resource_group, resource_type
+
+
+class ResourceLookup:
+    # Lists each (subscription, resource group) once and indexes it by lower-cased name and type
+    def __init__(self, session=azure_session):
+        self.session = session
+        self.indexes = {}
+
+    def get_client(self, subscription_id):
+        return self.session.get_client(subscription_id)
+
+    def index(self, subscription_id, resource_group_name):
+        key = (subscription_id.lower(), resource_group_name.lower())
+        index = self.indexes.get(key)
+        if index is None:
+            by_name_type, by_name = {}, {}
+            for resource in self.get_client(subscription_id).resources.list_by_resource_group(resource_group_name):
+                name = resource.name.lower()
+                by_name_type.setdefault((name, resource.type.lower()), resource)
+                by_name.setdefault(name, resource)
+            index = self.indexes[key] = (by_name_type, by_name)
+        return index
+
+    def find(self, subscription_id, resource_group_name, resource_name, resource_type=None):
+        by_name_type, by_name = self.index(subscription_id, resource_group_name)
+        if resource_type:
+            return by_name_type.get((resource_name.lower(), resource_type.lower()))
+        return by_name.get(resource_name.lower())
+
+    def get_api_version(self, subscription_id, resource_type):
+        return api_versions.get(self.get_client(subscription_id), subscription_id, resource_type)
+
+    def get_by_id(self, resource_id):
+        # Direct GET, no resource group enumeration
+        subscription_id, _, resource_type = parse_resource_id(resource_id)
+        api_version = self.get_api_version(subscription_id, resource_type)
+        if api_version is None:
+            raise ValueError(f"Resource type '{resource_type}' not found")
+        try:
+            return self.get_client(subscription_id).resources.get_by_id(resource_id, api_version)
+        except ResourceNotFoundError:
+            return None
+
+    def find_by_name(self, subscription_id, resource_group_name, resource_name):
+        # Server-side $filter instead of listing the whole resource group
+        name = resource_name.replace("'", "''")
+        resources = self.get_client(subscription_id).resources.list_by_resource_group(resource_group_name, filter=f"name eq '{name}'")
+        return next((resource for resource in resources if resource.name.lower() == resource_name.lower()), None)
+
+    def pull(self, subscription_id, resource_group_name, resource_name, index=None):
+        # The resource's tags as plain data, for az_cli.py and the daemon
+        resource = self.resolve(subscription_id, resource_group_name, resource_name, index)
+        if resource is None:
+            raise LookupError(f"Resource '{resource_name}' not found in resource group '{resource_group_name}'.")
+        return {'id': resource.id, 'name': resource.name, 'type': resource.type, 'tags': resource.tags or {}}
+
+    def resolve(self, subscription_id, resource_group_name, resource_name, index=None):
+        # Resource ID given directly, then IDs known to the inventory index, then a $filter query
+        if resource_name.startswith('/subscriptions/'):
+            return self.get_by_id(resource_name)
+        for resource_id in index.find(subscription_id, resource_group_name, resource_name) if index else []:
+            resource = self.get_by_id(resource_id)
+            if resource is not None:
+                return resource
+        resource = self.find_by_name(subscription_id, resource_group_name, resource_name)
+        if resource is not None and index is not None:
+            index.add(subscription_id, resource_group_name, resource.name, resource.id)
+        return resource
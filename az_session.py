@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import threading
+from azure.identity import DefaultAzureCredential, InteractiveBrowserCredential
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from azure.mgmt.resource import ResourceManagementClient
+from az_cache import cache_path
+from az_metrics import metrics
+
+# One credential and one pool of clients per process. Tokens are kept until shortly before they expire, so
+# checking authentication is a dictionary lookup once the first token is acquired. The browser fallback keeps
+# its tokens in the persistent MSAL cache, which DefaultAzureCredential also reads on the next start.
+ARM_SCOPE = "https://management.azure.com/.default"
+TOKEN_REFRESH_MARGIN = 300
+CONNECTION_POOL_SIZE = int(os.environ.get('AZ_CONNECTION_POOL_SIZE', 32))
+AUTHENTICATION_RECORD_FILE = 'authentication_record.json'
+# Overrides the Resource Manager endpoint, e.g. with the local fake server of az_fake_server.py
+ARM_ENDPOINT = os.environ.get('AZ_ARM_ENDPOINT')
+
+
+class CachingCredential:
+    def __init__(self, credential):
+        self.credential = credential
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def get_token(self, *scopes, **kwargs):
+        key = (scopes, kwargs.get('claims'), kwargs.get('tenant_id'))
+        with self.lock:
+            token = self.tokens.get(key)
+            if token is None or token.expires_on - time.time() < TOKEN_REFRESH_MARGIN:
+                token = self.tokens[key] = self.credential.get_token(*scopes, **kwargs)
+            return token
+
+    def close(self):
+        getattr(self.credential, 'close', lambda: None)()
+
+
+def browser_credential():
+    from azure.identity import AuthenticationRecord, TokenCachePersistenceOptions
+    record_file = cache_path(AUTHENTICATION_RECORD_FILE)
+    record = None
+    if os.path.exists(record_file):
+        with open(record_file) as file:
+            record = AuthenticationRecord.deserialize(file.read())
+    credential = InteractiveBrowserCredential(cache_persistence_options=TokenCachePersistenceOptions(), authentication_record=record)
+    try:
+        # The persistent cache is only opened here, by the first sign-in or token request
+        if record is not None:
+            credential.get_token(ARM_SCOPE)
+            return credential
+        record = credential.authenticate(scopes=[ARM_SCOPE])
+    except (ImportError, ValueError):
+        # No encrypted storage available for the persistent cache: sign in without it and keep no record
+        return InteractiveBrowserCredential()
+    with open(record_file, 'w') as file:
+        file.write(record.serialize())
+    return credential
+
+
+class AllowHttpPolicy(SansIOHTTPPolicy):
+    # The bearer token policy refuses plain http unless the request says otherwise
+    def on_request(self, request):
+        request.context['enforce_https'] = False
+
+
+def body_size(http_request):
+    return len(http_request.body) if isinstance(http_request.body, (bytes, str)) else 0
+
+
+class HttpMetricsPolicy(SansIOHTTPPolicy):
+    # Counts every attempt, retries included, per endpoint with its status and body sizes
+    def on_response(self, request, response):
+        http_request = request.http_request
+        metrics.record_http(http_request.method, http_request.url, response.http_response.status_code, sent=body_size(http_request),
+                            received=int(response.http_response.headers.get('Content-Length') or 0))
+
+    def on_exception(self, request):
+        metrics.record_http(request.http_request.method, request.http_request.url, 'error', sent=body_size(request.http_request))
+
+
+def build_transport():
+    import requests
+    from azure.core.pipeline.transport import RequestsTransport
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=CONNECTION_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
+
+class AzureSession:
+    def __init__(self):
+        self._credential = None
+        self.transport = None
+        self.clients = {}
+        self.lock = threading.RLock()
+
+    def authenticate(self, log=None):
+        log = log or logging.info
+        with self.lock:
+            if self._credential is None:
+                try:
+                    log("Attempting to authenticate using DefaultAzureCredential...")
+                    credential = DefaultAzureCredential()
+                    credential.get_token(ARM_SCOPE)
+                except Exception as e:
+                    log("DefaultAzureCredential failed. Falling back to InteractiveBrowserCredential.")
+                    log(str(e))
+                    credential = browser_credential()
+                self._credential = CachingCredential(credential)
+            return self._credential
+
+    def use_credential(self, credential):
+        # Skips authenticate(), e.g. with the FakeCredential of az_fake_server.py
+        with self.lock:
+            self._credential = CachingCredential(credential)
+            self.clients = {}
+
+    @property
+    def credential(self):
+        return self.authenticate()
+
+    def validate(self):
+        # Raises ClientAuthenticationError when no token can be acquired
+        self.credential.get_token(ARM_SCOPE)
+        return True
+
+    def get_client(self, subscription_id):
+        # Clients of every subscription share one HTTP connection pool
+        with self.lock:
+            client = self.clients.get(subscription_id.lower())
+            if client is None:
+                if self.transport is None:
+                    self.transport = build_transport()
+                options = {'per_retry_policies': [HttpMetricsPolicy()]}
+                if ARM_ENDPOINT:
+                    options['base_url'] = ARM_ENDPOINT
+                    if ARM_ENDPOINT.startswith('http://'):
+                        options['per_call_policies'] = [AllowHttpPolicy()]
+                client = ResourceManagementClient(self.credential, subscription_id, transport=self.transport, **options)
+                self.clients[subscription_id.lower()] = client
+            return client
+
+    def reset(self):
+        # Drops the credential and clients, e.g. after an authentication failure
+        with self.lock:
+            self._credential = None
+            self.clients = {}
+
+
+azure_session = AzureSession()
@@ -0,0 +1,125 @@
+import os
+import json
+import sqlite3
+import hashlib
+
+
+# Only the fixed export columns are hashed, with the ID and type lower-cased and empty strings read as null,
+# so switching AZ_EXPORT_BACKEND does not mark resources as changed. The extra TAG_* columns of the all-tags
+# mode are hashed separately and only compared when the snapshot was taken in the same mode.
+CASE_INSENSITIVE_COLUMNS = {"ID", "TYPE"}
+SNAPSHOT_VERSION = "2"
+
+
+def normalized(value, column=None):
+    if value == "":
+        return None
+    if column in CASE_INSENSITIVE_COLUMNS and isinstance(value, str):
+        return value.lower()
+    return value
+
+
+def digest(fields):
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def row_hash(row, columns):
+    return digest({column: normalized(row.get(column), column) for column in columns})
+
+
+def extra_tags_hash(row, columns):
+    return digest({key: normalized(value) for key, value in row.items() if key not in columns and normalized(value) is not None})
+
+
+class SnapshotStore:
+    # Keeps the exported fields of the previous run keyed by lower-cased resource ID, with content hashes per row
+    def __init__(self, path, columns, all_tags=False):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.columns = list(columns)
+        self.all_tags = "1" if all_tags else "0"
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS snapshot_rows (id TEXT PRIMARY KEY, hash TEXT NOT NULL, tags_hash TEXT NOT NULL, row TEXT NOT NULL)")
+        self.connection.execute("CREATE TEMP TABLE current (id TEXT PRIMARY KEY, hash TEXT NOT NULL, tags_hash TEXT NOT NULL, row TEXT NOT NULL)")
+        settings = dict(self.connection.execute("SELECT name, value FROM settings"))
+        if settings.get("version") != SNAPSHOT_VERSION or settings.get("columns") != json.dumps(self.columns):
+            self.rehash()
+            settings = {}
+        # Extra tag columns are compared only between two runs of the same mode
+        self.compare_tags = settings.get("all_tags") == self.all_tags
+
+    def rehash(self):
+        # Snapshots of an older version or other export columns keep their rows, hashed the current way
+        with self.connection:
+            if self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'snapshot'").fetchone():
+                self.connection.execute("INSERT OR REPLACE INTO snapshot_rows SELECT id, '', '', row FROM snapshot")
+                self.connection.execute("DROP TABLE snapshot")
+            rows = [(row_hash(row, self.columns), extra_tags_hash(row, self.columns), row_id)
+                    for row_id, row in ((row_id, json.loads(row)) for row_id, row in self.connection.execute("SELECT id, row FROM snapshot_rows"))]
+            self.connection.executemany("UPDATE snapshot_rows SET hash = ?, tags_hash = ? WHERE id = ?", rows)
+            self.connection.execute("DELETE FROM settings")
+
+    def has_snapshot(self):
+        return self.connection.execute("SELECT 1 FROM snapshot_rows LIMIT 1").fetchone() is not None
+
+    def add_rows(self, rows):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO current (id, hash, tags_hash, row) VALUES (?, ?, ?, ?)",
+            ((row["ID"].lower(), row_hash(row, self.columns), extra_tags_hash(row, self.columns), json.dumps(row, default=str)) for row in rows)
+        )
+
+    def keep_subscription(self, subscription_id):
+        # Carries the previous rows of a subscription that could not be listed, so they are not reported as removed
+        self.connection.execute(
+            "INSERT OR IGNORE INTO current SELECT id, hash, tags_hash, row FROM snapshot_rows WHERE id LIKE ?",
+            (f"/subscriptions/{subscription_id.lower()}/%",)
+        )
+
+    def diff(self):
+        query = self.connection.execute
+        for (row,) in query("SELECT c.row FROM current c LEFT JOIN snapshot_rows s ON s.id = c.id WHERE s.id IS NULL"):
+            yield "added", json.loads(row), None
+        for (row,) in query("SELECT s.row FROM snapshot_rows s LEFT JOIN current c ON c.id = s.id WHERE c.id IS NULL"):
+            yield "removed", json.loads(row), None
+        changed = "s.hash != c.hash OR s.tags_hash != c.tags_hash" if self.compare_tags else "s.hash != c.hash"
+        for row, previous in query(f"SELECT c.row, s.row FROM current c JOIN snapshot_rows s ON s.id = c.id WHERE {changed}"):
+            yield "changed", json.loads(row), json.loads(previous)
+
+    def commit(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM snapshot_rows")
+            self.connection.execute("INSERT INTO snapshot_rows SELECT id, hash, tags_hash, row FROM current")
+            self.connection.executemany("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)",
+                                        [("version", SNAPSHOT_VERSION), ("columns", json.dumps(self.columns)), ("all_tags", self.all_tags)])
+        self.connection.execute("DELETE FROM current")
+
+    def close(self):
+        self.connection.close()
+
+
+class DeltaSink:
+    extension = "_Delta.jsonl"
+
+    # Export sink that writes only the resources added, removed or changed since the previous snapshot
+    def __init__(self, store, path):
+        self.store = store
+        self.path = path
+        self.counts = {"added": 0, "removed": 0, "changed": 0}
+
+    def write_rows(self, rows, columns):
+        self.store.add_rows(rows)
+
+    def close(self, columns):
+        with open(self.path, "w", encoding="utf-8") as report:
+            for change, row, previous in self.store.diff():
+                self.counts[change] += 1
+                record = {"change": change, "ID": row["ID"]}
+                if change == "changed":
+                    keys = list(columns) + (sorted((set(row) | set(previous)) - set(columns)) if self.store.compare_tags else [])
+                    record["changes"] = {k: [previous.get(k), row.get(k)] for k in keys
+                                         if normalized(previous.get(k), k) != normalized(row.get(k), k)}
+                else:
+                    record["resource"] = row
+                report.write(json.dumps(record) + "\n")
+        self.store.commit()
+        self.store.close()
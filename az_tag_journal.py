@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import atexit
+import uuid
+import threading
+from datetime import datetime
+
+# Append-only JSONL journal of tag runs, read back by --resume and az_tag_rollback.py. Every row gets one or more entries (the last one wins):
+# pending when its update is submitted, then succeeded/failed, or unchanged/not_found/excluded.
+# Entries are written through a buffer and fsync'ed in batches.
+TAG_JOURNAL_DIRECTORY = os.environ.get('AZ_TAG_JOURNAL_DIR', os.path.join(os.path.expanduser("~"), "ResourceTagLogs"))
+TAG_JOURNAL_SYNC_EVERY = int(os.environ.get('AZ_TAG_JOURNAL_SYNC_EVERY', 100))
+TAG_JOURNAL_SYNC_INTERVAL = float(os.environ.get('AZ_TAG_JOURNAL_SYNC_INTERVAL', 2))
+COMPLETED_OUTCOMES = {'succeeded', 'unchanged', 'excluded'}
+
+
+def row_key(subscription_id, resource_group_name, resource_name, resource_type=None, resource_id=None):
+    if resource_id:
+        return resource_id.lower()
+    parts = [subscription_id, resource_group_name, resource_name] + ([resource_type] if resource_type else [])
+    return '/'.join(str(part) for part in parts).lower()
+
+
+def journal_path(name):
+    return os.path.join(TAG_JOURNAL_DIRECTORY, f"{name}.journal.jsonl")
+
+
+def read_journal(path):
+    if not os.path.exists(path):
+        return
+    with open(path) as journal:
+        for line in journal:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+
+
+class TagJournal:
+    def __init__(self, path, sync_every=TAG_JOURNAL_SYNC_EVERY, sync_interval=TAG_JOURNAL_SYNC_INTERVAL):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.run_id = None
+        self.handle = None
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def start(self, resume=False):
+        # Returns the keys already completed by the run being resumed; a new run starts with none. resume is
+        # True for the run started last in the journal, or the id of a run. Several processes may append to
+        # one journal, so the entries of the resumed run are picked by their run id, not by their position.
+        completed = set()
+        if resume:
+            runs = list(dict.fromkeys(entry.get('run') for entry in read_journal(self.path)))
+            if resume is not True and resume not in runs:
+                raise ValueError(f"No run '{resume}' in journal {self.path}")
+            self.run_id = resume if resume is not True else (runs[-1] if runs else None)
+            for entry in read_journal(self.path):
+                if entry.get('run') != self.run_id:
+                    continue
+                if entry.get('outcome') in COMPLETED_OUTCOMES:
+                    completed.add(entry['key'])
+                else:
+                    completed.discard(entry['key'])
+        if self.run_id is None:
+            # Unique across processes starting in the same second, and still sorted by start time
+            self.run_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.handle = open(self.path, 'a+')
+        # Synced and closed at exit if the script dies first; close() unregisters it, so a long-running process
+        # such as the daemon does not collect one exit handler per run
+        atexit.register(self.close)
+        self.handle.seek(0, os.SEEK_END)
+        if self.handle.tell():
+            self.handle.seek(self.handle.tell() - 1)
+            if self.handle.read(1) != '\n':
+                self.handle.write('\n')
+        return completed
+
+    def record(self, key, outcome, **fields):
+        entry = {'time': datetime.now().isoformat(timespec='seconds'), 'run': self.run_id, 'key': key, 'outcome': outcome, **fields}
+        with self.lock:
+            self.handle.write(json.dumps(entry, default=str) + '\n')
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every or time.monotonic() - self.synced_at >= self.sync_interval:
+                self.sync()
+
+    def sync(self):
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def close(self):
+        atexit.unregister(self.close)
+        with self.lock:
+            if self.handle and not self.handle.closed:
+                self.sync()
+                self.handle.close()
@@ -0,0 +1,119 @@
+import os
+import sys
+import runpy
+import argparse
+import pandas as pd
+from az_resource_lookup import parse_resource_id
+from az_resource_index import latest_inventory, FULL_EXPORT_HINT
+from az_tag_reader import as_text
+
+# plan: joins the desired-tags sheet against an inventory exported by Get_AZ_Resources.py and keeps only the
+#       rows whose tags would change, plus rows missing from the inventory, together with a readable diff.
+# apply: runs Update_AZ_Multiple_Resource_Tag.py on the plan, which carries resource IDs so no lookups are needed.
+KEY_COLUMNS = ['subscription_id', 'resource_group_name', 'resource_name']
+INVENTORY_KEYS = ['SUBSCRIPTION_ID', 'RESOURCE_GROUP', 'RESOURCE_NAME']
+JOIN_KEYS = ['_subscription', '_resource_group', '_name']
+
+
+def read_table(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if path.endswith('.jsonl'):
+        return pd.read_json(path, lines=True, dtype=False)
+    if path.endswith(('.csv', '.csv.gz')):
+        return pd.read_csv(path, dtype=str)
+    return pd.read_excel(path)
+
+
+def tag_key(column):
+    return column[:-len('_tag')].replace('_', '-')
+
+
+def inventory_column(column):
+    return 'TAG_' + column[:-len('_tag')].upper()
+
+
+def build_plan(sheet, inventory):
+    sheet = sheet.reset_index(drop=True)
+    tag_columns = [column for column in sheet.columns if column.endswith('_tag')]
+    inventory_tags = [inventory_column(column) for column in tag_columns if inventory_column(column) in inventory.columns]
+
+    left = sheet.assign(**{key: as_text(sheet[column]).str.lower() for key, column in zip(JOIN_KEYS, KEY_COLUMNS)})
+    right = inventory[INVENTORY_KEYS + ['ID'] + inventory_tags].copy()
+    for key, column in zip(JOIN_KEYS, INVENTORY_KEYS):
+        right[key] = as_text(right[column]).str.lower()
+    right['_type'] = right['ID'].map(lambda resource_id: (parse_resource_id(resource_id)[2] or '').lower())
+    right = right.drop(columns=INVENTORY_KEYS)
+
+    # Rows naming a resource type must match it; the others take the first resource with that name
+    typed = as_text(sheet['resource_type']).str.lower() if 'resource_type' in sheet.columns else pd.Series(pd.NA, index=sheet.index, dtype='string')
+    left['_type'] = typed
+    merged = pd.concat([
+        left[typed.notna()].reset_index().merge(right, how='left', on=JOIN_KEYS + ['_type']),
+        left[typed.isna()].drop(columns='_type').reset_index().merge(right.drop_duplicates(JOIN_KEYS), how='left', on=JOIN_KEYS)
+    ]).drop_duplicates('index').set_index('index').sort_index()
+
+    found = merged['ID'].notna()
+    changes = pd.DataFrame(index=merged.index)
+    wanted = pd.Series(False, index=merged.index)
+    for column in tag_columns:
+        desired = as_text(merged[column])
+        wanted |= desired.notna()
+        current = as_text(merged[inventory_column(column)]) if inventory_column(column) in merged.columns else pd.Series(pd.NA, index=merged.index, dtype='string')
+        changes[column] = desired.notna() & ~(desired == current).fillna(False)
+    selected = (found & changes.any(axis=1)) | (~found & wanted)
+
+    plan = sheet.loc[selected].copy()
+    plan['resource_id'] = merged.loc[selected, 'ID']
+    diff = []
+    for index in plan.index:
+        name = '/'.join(str(sheet.at[index, column]) for column in KEY_COLUMNS)
+        if not found[index]:
+            diff.append(f"{name}: not in inventory, will be looked up")
+            continue
+        for column in tag_columns:
+            if changes.at[index, column]:
+                current = merged.at[index, inventory_column(column)] if inventory_column(column) in merged.columns else None
+                diff.append(f"{name}: {tag_key(column)}: {None if pd.isna(current) else current!r} -> {as_text(sheet[column]).at[index]!r}")
+    return plan, diff
+
+
+def plan_command(args):
+    # Without an explicit inventory the newest full export is used; delta reports only list the changes
+    inventory = args.inventory or latest_inventory()
+    if inventory is None:
+        sys.exit(FULL_EXPORT_HINT)
+    sheet = read_table(args.sheet)
+    plan, diff = build_plan(sheet, read_table(inventory))
+    plan.to_excel(args.out, index=False)
+    diff_file = os.path.splitext(args.out)[0] + '.diff.txt'
+    with open(diff_file, 'w') as output:
+        output.write('\n'.join(diff) + ('\n' if diff else ''))
+    print('\n'.join(diff))
+    print(f"{len(plan)} of {len(sheet)} rows need an update. Plan written to '{args.out}', diff to '{diff_file}'.")
+
+
+def apply_command(args):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Update_AZ_Multiple_Resource_Tag.py')
+    sys.argv = [script, args.plan]
+    runpy.run_path(script, run_name='__main__')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan and apply bulk tag updates against an exported inventory.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    plan_parser = commands.add_parser('plan', help="Write the rows of the tag sheet whose tags would change")
+    plan_parser.add_argument('sheet', help="Desired tags sheet (resource_tags.xlsx format)")
+    plan_parser.add_argument('inventory', nargs='?', help="Inventory exported by Get_AZ_Resources.py (.xlsx, .csv.gz, .jsonl or .parquet); "
+                                                         "defaults to the newest full export")
+    plan_parser.add_argument('--out', default='tag_plan.xlsx')
+    plan_parser.set_defaults(handler=plan_command)
+    apply_parser = commands.add_parser('apply', help="Run the bulk updater on a plan")
+    apply_parser.add_argument('plan', nargs='?', default='tag_plan.xlsx')
+    apply_parser.set_defaults(handler=apply_command)
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import os
+import itertools
+import pandas as pd
+
+# Streams a tag sheet (.xlsx, .csv, .csv.gz or .parquet) in fixed-size chunks. Each chunk is validated and
+# normalised as a whole and handed out as TagRow tuples, so the full sheet is never held in memory.
+TAG_READ_CHUNK_SIZE = int(os.environ.get('AZ_TAG_READ_CHUNK_SIZE', 5000))
+REQUIRED_COLUMNS = ['subscription_id', 'resource_group_name', 'resource_name']
+OPTIONAL_COLUMNS = ['resource_type', 'resource_id']
+TAG_COLUMNS = {
+    'owner_tag': 'owner',
+    'application_tag': 'application',
+    'environment_tag': 'environment',
+    'cost_center_tag': 'cost-center'
+}
+ROW_FIELDS = ['row_number'] + REQUIRED_COLUMNS + OPTIONAL_COLUMNS + list(TAG_COLUMNS)
+
+
+def as_text(series):
+    # Spreadsheet cells holding whole numbers come back as floats when the column has blanks
+    if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+        series = series.astype('Int64')
+    return series.astype('string').str.strip().replace('', pd.NA)
+
+
+def excel_chunks(path, chunk_size):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else '' for name in next(rows, ())]
+        while True:
+            batch = list(itertools.islice(rows, chunk_size))
+            if not batch:
+                break
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def parquet_chunks(path, chunk_size):
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        yield batch.to_pandas()
+
+
+def read_chunks(path, chunk_size=TAG_READ_CHUNK_SIZE):
+    if path.endswith('.parquet'):
+        return parquet_chunks(path, chunk_size)
+    if path.endswith(('.csv', '.csv.gz')):
+        return pd.read_csv(path, dtype=str, chunksize=chunk_size)
+    return excel_chunks(path, chunk_size)
+
+
+def prepare_chunk(chunk, first_row):
+    missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    chunk = chunk.reset_index(drop=True)
+    prepared = pd.DataFrame({'row_number': chunk.index + first_row})
+    for column in ROW_FIELDS[1:]:
+        prepared[column] = as_text(chunk[column]) if column in chunk.columns else pd.NA
+    # Blank cells become None; rows without a resource ID need all the required columns
+    prepared = prepared.astype(object).where(prepared.notna(), None)
+    valid = prepared['resource_id'].notna() | prepared[REQUIRED_COLUMNS].notna().all(axis=1)
+    return prepared[valid], prepared.loc[~valid, 'row_number'].tolist()
+
+
+def read_rows(path, chunk_size=TAG_READ_CHUNK_SIZE, log=None):
+    # Yields TagRow tuples; row_number is the row in the sheet, counting the header as row 1
+    first_row = 2
+    for chunk in read_chunks(path, chunk_size):
+        rows, invalid = prepare_chunk(chunk, first_row)
+        first_row += len(chunk)
+        if invalid and log:
+            log(f"Skipping rows {', '.join(map(str, invalid))}: missing {', '.join(REQUIRED_COLUMNS)}")
+        yield from rows.itertuples(index=False, name='TagRow')
+
+
+def row_tags(row):
+    # Blank cells leave the tag as it is
+    return {key: getattr(row, column) for column, key in TAG_COLUMNS.items() if getattr(row, column) is not None}
@@ -0,0 +1,193 @@
+import sys
+import time
+import argparse
+import threading
+from types import SimpleNamespace
+from functools import partial
+from concurrent.futures import wait, FIRST_COMPLETED
+from az_resource_lookup import parse_resource_id
+from az_tag_writer import tag_writer
+from az_lro import lro_scheduler
+from az_bulk_executor import BulkTagExecutor
+from az_tag_journal import TagJournal, read_journal, journal_path
+from az_event_log import event_log, elapsed_ms
+from az_daemon_client import forward
+
+# Reverts tag updates recorded in a journal (see az_tag_journal.py). Only the keys an update set are restored,
+# and a resource is skipped when any of those keys no longer holds the value the update wrote. The restored
+# keys are written with Merge and the keys the update added are removed with Delete, so tags changed by
+# anyone else in the meantime are left alone.
+ROLLBACK_OUTCOMES = {'succeeded', 'pending'}
+
+
+def journal_runs(path):
+    runs = {}
+    for entry in read_journal(path):
+        runs[entry.get('run')] = runs.get(entry.get('run'), 0) + 1
+    return runs
+
+
+def select_entries(path, run_id=None, subscription_id=None, resource_group=None, match=None):
+    # Latest entry per resource of the run (the last run by default) that may have changed its tags
+    latest = {}
+    for entry in read_journal(path):
+        latest.setdefault(entry.get('run'), {})[entry['key']] = entry
+    if not latest:
+        return []
+    entries = latest.get(run_id if run_id is not None else list(latest)[-1], {}).values()
+    selected = []
+    for entry in entries:
+        if entry.get('outcome') not in ROLLBACK_OUTCOMES or not entry.get('resource_id') or not entry.get('new_tags'):
+            continue
+        entry_subscription, entry_group, _ = parse_resource_id(entry['resource_id'])
+        if subscription_id and (entry_subscription or '').lower() != subscription_id.lower():
+            continue
+        if resource_group and (entry_group or '').lower() != resource_group.lower():
+            continue
+        if match and match.lower() not in entry['resource_id'].lower():
+            continue
+        selected.append(entry)
+    return selected
+
+
+def restored_tags(entry):
+    # Prior values of the keys the update set; None as a value means the key did not exist before
+    prior_tags = entry.get('prior_tags') or {}
+    return {key: prior_tags.get(key) for key in entry['new_tags']}
+
+
+def has_drifted(current_tags, entry):
+    # A key already back at its prior value (a retried or repeated rollback) has not drifted
+    restored = restored_tags(entry)
+    return any(current_tags.get(key) not in (value, restored[key]) for key, value in entry['new_tags'].items())
+
+
+class TagRollback:
+    def __init__(self, get_client, executor=None, journal=None, log=None):
+        # get_client(subscription_id) returns a ResourceManagementClient
+        self.get_client = get_client
+        self.executor = executor or BulkTagExecutor(log=log)
+        self.journal = journal
+        self.log = log or print
+        self.recorded = {}
+        # Set on cancel; each revert checks it before it starts writing, so no resource is left half restored
+        self.cancel_event = threading.Event()
+
+    def revert(self, entry, raw_response_hook=None, **kwargs):
+        if self.cancel_event.is_set():
+            return 'cancelled'
+        subscription_id, _, resource_type = parse_resource_id(entry['resource_id'])
+        client = self.get_client(subscription_id)
+        current_tags = client.tags.get_at_scope(entry['resource_id']).properties.tags or {}
+        if has_drifted(current_tags, entry):
+            return 'drifted'
+        restored = restored_tags(entry)
+        merge = {key: value for key, value in restored.items() if value is not None and current_tags.get(key) != value}
+        # Delete with the value the update wrote only removes the key while it still holds that value
+        delete = {key: entry['new_tags'][key] for key, value in restored.items() if value is None and key in current_tags}
+        if self.cancel_event.is_set():
+            return 'cancelled'
+        recorded = self.recorded[entry['key']] = dict(resource_id=entry['resource_id'], prior_tags=current_tags, new_tags=restored)
+        if self.journal:
+            self.journal.record(entry['key'], 'pending', **recorded)
+        resource = SimpleNamespace(id=entry['resource_id'], type=resource_type, tags=current_tags, location=None, properties=None, sku=None)
+        result = True
+        for operation, tags in [('Merge', merge), ('Delete', delete)]:
+            if not tags:
+                continue
+            start = partial(tag_writer.begin_update, client, resource, tags, operation=operation)
+            result = lro_scheduler.begin(client, start, raw_response_hook=raw_response_hook, **kwargs)
+            if operation == 'Merge' and delete:
+                # The Delete is only sent once the Merge completed; the resource update fallback starts from its tags
+                result.result()
+                resource.tags = {**current_tags, **tags}
+        return result
+
+    def rollback(self, entries, cancelled=None):
+        # Returns the number of reverted, drifted, failed and cancelled resources
+        futures = {}
+        for entry in entries:
+            subscription_id = parse_resource_id(entry['resource_id'])[0]
+            stats = {'started': time.perf_counter()}
+            futures[self.executor.submit(subscription_id, partial(self.revert, entry), stats=stats)] = (entry, stats)
+        counts = {'reverted': 0, 'drifted': 0, 'failed': 0, 'cancelled': 0}
+        report_every = max(1, len(futures) // 20)
+        pending = set(futures)
+        while pending:
+            if cancelled and cancelled() and not self.cancel_event.is_set():
+                # Writes already sent finish and are journaled; the rest return without writing
+                self.cancel_event.set()
+                self.log("Rollback cancelled.")
+            done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry, stats = futures[future]
+                event = dict(resource_id=entry['resource_id'], old_tags=entry['new_tags'], new_tags=self.recorded.get(entry['key'], {}).get('new_tags'),
+                             latency_ms=elapsed_ms(stats['started']), status=stats.get('status'), retries=stats.get('retries'))
+                try:
+                    result = future.result()
+                    if result == 'cancelled':
+                        counts['cancelled'] += 1
+                    elif result == 'drifted':
+                        counts['drifted'] += 1
+                        self.log(f"Skipping '{entry['resource_id']}': tags changed since the update.")
+                        event_log.record('rollback_tags', outcome='drifted', **event)
+                    else:
+                        counts['reverted'] += 1
+                        if self.journal:
+                            self.journal.record(entry['key'], 'succeeded', rolled_back=entry.get('run'), **self.recorded.get(entry['key'], {}))
+                        event_log.record('rollback_tags', outcome='succeeded', **event)
+                except Exception as e:
+                    counts['failed'] += 1
+                    self.log(f"Failed to roll back tags for '{entry['resource_id']}'. Error: {str(e)}")
+                    event_log.record('rollback_tags', outcome='failed', error=str(e), **event)
+                finished = sum(counts.values())
+                if finished % report_every == 0 or finished == len(futures):
+                    self.log(f"Rolled back {counts['reverted']} of {len(futures)} resources ({counts['drifted']} drifted, {counts['failed']} failed, {counts['cancelled']} cancelled).")
+        return counts
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def main(argv=None):
+    from az_session import azure_session
+
+    parser = argparse.ArgumentParser(description="Roll back tag updates recorded in a journal.")
+    parser.add_argument('journal', help="Journal written by a tagging script (~/ResourceTagLogs/*.journal.jsonl)")
+    parser.add_argument('--run', help="Run to roll back (default: the last run in the journal)")
+    parser.add_argument('--subscription', help="Only resources in this subscription")
+    parser.add_argument('--resource-group', help="Only resources in this resource group")
+    parser.add_argument('--match', help="Only resources whose ID contains this text")
+    parser.add_argument('--list-runs', action='store_true', help="List the runs in the journal and exit")
+    parser.add_argument('--dry-run', action='store_true', help="Show what would be rolled back")
+    args = parser.parse_args(argv)
+
+    if args.list_runs:
+        for run_id, count in journal_runs(args.journal).items():
+            print(f"{run_id}: {count} entries")
+        return
+    entries = select_entries(args.journal, args.run, args.subscription, args.resource_group, args.match)
+    if args.dry_run or not entries:
+        for entry in entries:
+            print(f"{entry['resource_id']}: {entry['new_tags']} -> {entry.get('prior_tags') or {}}")
+        print(f"{len(entries)} resources to roll back.")
+        return
+
+    # Runs in the tagging daemon when one is running
+    job = forward('rollback', argv=sys.argv[1:] if argv is None else list(argv))
+    if job:
+        return 0 if job['status'] == 'succeeded' else 1
+
+    # The rollback is journaled like any other run, so it can be rolled back in turn
+    journal = TagJournal(journal_path('rollback'))
+    journal.start()
+    engine = TagRollback(azure_session.get_client, journal=journal)
+    try:
+        engine.rollback(entries)
+    finally:
+        engine.shutdown()
+        journal.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import os
+import logging
+from azure.core.exceptions import HttpResponseError
+from azure.mgmt.resource.resources.models import GenericResource, Tags, TagsPatchResource
+from az_api_versions import api_versions
+from az_resource_lookup import parse_resource_id
+from az_tag_journal import row_key
+from az_event_log import event_log
+from az_metrics import metrics
+
+# 'tags' sends only the tag change through the Tags API (tags.begin_update_at_scope), with no API version lookup.
+# 'resource' updates the whole resource through begin_update_by_id, which is also the fallback for providers
+# that reject the Tags API.
+TAG_WRITE_MODE = os.environ.get('AZ_TAG_WRITE_MODE', 'tags')
+TAGS_API_UNSUPPORTED = (400, 405)
+
+
+def apply_tag_operation(current_tags, tags, operation):
+    if operation == 'Replace':
+        return dict(tags)
+    if operation == 'Delete':
+        # Like the Tags API, a key given with a value is only deleted while it holds that value
+        return {key: value for key, value in current_tags.items() if key not in tags or tags[key] not in (None, '', value)}
+    return {**current_tags, **tags}
+
+
+class TagWriter:
+    def __init__(self, mode=TAG_WRITE_MODE, log=None):
+        self.mode = mode
+        self.log = log or logging.info
+
+    def begin_update(self, client, resource, tags, operation='Merge', full_resource=False, **kwargs):
+        with metrics.span('update'):
+            return self.send_update(client, resource, tags, operation, full_resource, **kwargs)
+
+    def send_update(self, client, resource, tags, operation='Merge', full_resource=False, **kwargs):
+        if self.mode == 'tags':
+            try:
+                return client.tags.begin_update_at_scope(resource.id, TagsPatchResource(operation=operation, properties=Tags(tags=tags)), **kwargs)
+            except HttpResponseError as e:
+                if e.status_code not in TAGS_API_UNSUPPORTED:
+                    raise
+                self.log(f"Tags API not supported for '{resource.id}', updating the resource instead. Error: {e.message}")
+        return self.begin_resource_update(client, resource, tags, operation, full_resource, **kwargs)
+
+    def begin_resource_update(self, client, resource, tags, operation='Merge', full_resource=False, **kwargs):
+        api_version = api_versions.get(client, parse_resource_id(resource.id)[0], resource.type)
+        if api_version is None:
+            raise ValueError(f"Could not find API version for resource type '{resource.type}'")
+        updated_tags = apply_tag_operation(resource.tags or {}, tags, operation)
+        if full_resource:
+            parameters = GenericResource(
+                location=resource.location,
+                tags=updated_tags,
+                properties=resource.properties if resource.properties else {},
+                sku=resource.sku if resource.sku else None
+            )
+        else:
+            parameters = {"tags": updated_tags}
+        # The full payload is only dumped with AZ_TAG_VERBOSE=1
+        event_log.payload('resource_update_request', resource_id=resource.id, api_version=api_version,
+                          parameters=parameters.as_dict() if hasattr(parameters, 'as_dict') else parameters)
+        return client.resources.begin_update_by_id(resource.id, api_version, parameters=parameters, **kwargs)
+
+
+tag_writer = TagWriter()
+
+
+def update_resource_tags(lookup, subscription_id, resource_group, resource_name, tags, journal, writer=tag_writer, index=None, log=print):
+    # Single resource update shared by Update_AZ_Resource_Tag.py, az_cli.py and the daemon. resource_name may
+    # also be a resource ID. The prior tags are journaled so the update can be undone with az_tag_rollback.py.
+    resource = lookup.resolve(subscription_id, resource_group, resource_name, index)
+    if resource is None:
+        raise LookupError(f"Resource '{resource_name}' not found in resource group '{resource_group}'.")
+    resource_tags = resource.tags or {}
+    changed_tags = {key: value for key, value in tags.items() if resource_tags.get(key) != value}
+    if not changed_tags:
+        log(f"Tags for resource '{resource.name}' are already up to date.")
+        return {'id': resource.id, 'tags': resource_tags}
+    log(f"Updating tags for resource: '{resource.name}' in '{resource_group}' from '{subscription_id}' subscription.")
+    key = row_key(subscription_id, resource_group, resource_name)
+    entry = dict(resource_id=resource.id, prior_tags=resource_tags, new_tags=changed_tags)
+    journal.record(key, 'pending', **entry)
+    try:
+        with event_log.operation('update_tags', resource_id=resource.id, old_tags={tag: resource_tags.get(tag) for tag in changed_tags}, new_tags=changed_tags):
+            writer.begin_update(lookup.get_client(subscription_id), resource, changed_tags).result()
+    except Exception as e:
+        journal.record(key, 'failed', error=str(e), **entry)
+        raise
+    journal.record(key, 'succeeded', **entry)
+    log(f"Successfully updated tags for resource: '{resource.name}'. Updated tags: {changed_tags}")
+    return {'id': resource.id, 'tags': {**resource_tags, **changed_tags}}